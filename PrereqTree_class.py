@@ -6,6 +6,14 @@ The module contains the class PrereqTree, which is used to parse Prerequisite st
 """
 from __future__ import annotations
 import re
+import sys
+from typing import Iterator, Tuple
+
+COURSE_CODE = r'[A-Z]{3}[0-9]{3}[H,Y]1'
+
+# patterns are compiled once, since they are used for every requisite string in the catalog
+_COURSE = re.compile(COURSE_CODE)
+_TOKEN = re.compile(rf'{COURSE_CODE}|[/,()]')
 
 
 class PrereqTree:
@@ -20,6 +28,7 @@ class PrereqTree:
         - self.item == 'and' or self.item == 'or' or self.item = '' or
             re.fullmatch(r'[A-Z]{3}[0-9]{3}[H,Y]1', self.item) is not None
     """
+    __slots__ = ('item', 'subtrees')
     item: str
     subtrees: list[PrereqTree]
 
@@ -29,85 +38,80 @@ class PrereqTree:
         It should be in the format described in the academic calendar for course lists.
         """
         # remove all whitespace
-        prereq_str = re.sub(r'\s+', '', prereq_str)
+        prereq_str = ''.join(prereq_str.split())
         # commas and semicolons and pluses all mean the same thing in course lists
-        prereq_str = prereq_str.replace(';', ',')
-        prereq_str = prereq_str.replace('+', ',')
+        prereq_str = prereq_str.replace(';', ',').replace('+', ',')
 
         # deal base case of prereq_str being just a single course:
-        if re.fullmatch(r'[A-Z]{3}[0-9]{3}[H,Y]1', prereq_str) is not None:
-            self.item = prereq_str
+        if _COURSE.fullmatch(prereq_str) is not None:
+            self.item = sys.intern(prereq_str)
             self.subtrees = []
             return
 
-        # tokenize the prereq string into courses codes, commas, forward slashes and parentheses
-        split_str = re.findall(r'(?:(?:[A-Z]{3}[0-9]{3}[H,Y]1)|[/,()])', prereq_str)
-
-        split_str = combine_parentheses(split_str)
-
-        ors = []  # list of each or(/) block.
-        current = []
-        for substr in split_str:
-            if substr == ',':
-                ors.append(current)
-                current = []
-            elif substr != '/':
-                current.append(substr)
-
-        if current != '':
-            ors.append(current)
-
-        if len(ors) == 1:
-            if len(ors[0]) >= 1:
-                self.item = 'or'
-                self.subtrees = []
-                for el in ors[0]:
-                    self.subtrees.append(PrereqTree(el))
-            else:
-                self.subtrees = []
-                self.item = ''
-        else:
-            self.item = 'and'
-            self.subtrees = []
-            for el in ors:
-                self.subtrees.append(PrereqTree('/'.join(el)))
+        # tokenize the prereq string into courses codes, commas, forward slashes and parentheses,
+        # then build the whole tree in one pass over that token stream
+        self.item, self.subtrees = parse_tokens(iter(_TOKEN.findall(prereq_str)), False)[:2]
+
+    def courses(self) -> set[str]:
+        """Return the set of the course codes that appear in this tree."""
+        if self.subtrees == []:
+            return {self.item} if self.item != '' else set()
+        return set().union(*(subtree.courses() for subtree in self.subtrees))
+
 
+def parse_tokens(tokens: Iterator[str], nested: bool) -> Tuple[str, list[PrereqTree], int, int]:
+    """Parse tokens into the item and subtrees of a tree. Return them together with the number of
+    course codes and the number of tokens used (not counting a closing ')').
 
-def combine_parentheses(split_str: list[str]) -> list[str]:
-    """Takes a tokenized prereq string and combines each parenthetical
-    into a single string (which is later recursed on)
+    If nested, parsing stops after the ')' closing the group (or at the end of tokens, if the
+    group is never closed). Otherwise unmatched ')' are ignored. Parenthesized groups that contain
+    no course codes are dropped, and '/' is implied between adjacent items.
     """
-    while '(' in split_str:
-        first_paren = split_str.index('(')
-        nest = 1
-        length = 1
-        while nest >= 1:
-            if length + first_paren >= len(split_str):
-                # this should only occur if there are unmatched parentheses
-                split_str.append(')')
-
-            substr = split_str[length + first_paren]
-            length += 1
-            if substr == '(':
-                nest += 1
-            elif substr == ')':
-                nest -= 1
-
-        # join the parenthesized string together (without the parentheses included)
-        parenthesized_str = ''.join(split_str[first_paren + 1:first_paren + length - 1])
-
-        if re.search(r'[A-Z]{3}[0-9]{3}[H,Y]1', parenthesized_str) is None:
-            # if the parenthesized string includes no course codes then we remove it
-            split_str = split_str[0: first_paren] + split_str[first_paren + length:]
+    blocks = [[]]  # list of and(,) blocks, each of which is a list of or(/) items
+    num_courses = 0
+    num_tokens = 0
+    for token in tokens:
+        if token == ')':
+            if nested:
+                break
+            continue
+        num_tokens += 1
+        if token == ',':
+            blocks.append([])
+        elif token == '(':
+            item, subtrees, group_courses, group_tokens = parse_tokens(tokens, True)
+            num_tokens += group_tokens + 1
+            if group_courses > 0:
+                blocks[-1].append(_node(item, subtrees))
+                num_courses += group_courses
+        elif token != '/':
+            # course codes are interned, so that every occurrence of a course shares one string
+            blocks[-1].append(_node(sys.intern(token), []))
+            num_courses += 1
+
+    if nested and num_tokens == 1 and num_courses == 1:
+        # a group holding only a course code is just that course
+        return blocks[0][0].item, [], 1, 1
+
+    if len(blocks) == 1:
+        if len(blocks[0]) >= 1:
+            return 'or', blocks[0], num_courses, num_tokens
+        return '', [], num_courses, num_tokens
+
+    subtrees = []
+    for block in blocks:
+        if len(block) == 1:
+            subtrees.append(block[0])
+        elif len(block) == 0:
+            subtrees.append(_node('', []))
         else:
-            # otherwise insert it into split str, replacing the indices that were used by
-            # its constituent parts
-            split_str = split_str[0: first_paren] + [parenthesized_str] + \
-                        split_str[first_paren + length:]
+            subtrees.append(_node('or', block))
+    return 'and', subtrees, num_courses, num_tokens
 
-    while ')' in split_str:  # this should only happen if there is some ')' which is
-        # not matching a ')'.
-        index = split_str.index(')')
-        split_str = split_str[:index] + split_str[index + 1:]
 
-    return split_str
+def _node(item: str, subtrees: list[PrereqTree]) -> PrereqTree:
+    """Return a new tree with the given item and subtrees, without parsing anything."""
+    tree = object.__new__(PrereqTree)
+    tree.item = item
+    tree.subtrees = subtrees
+    return tree
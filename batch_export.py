@@ -0,0 +1,149 @@
+"""CSC111 Project: University of Toronto Course Finder: Batch Export
+
+Module Description:
+====================
+The module contains a command line tool that renders the prerequisite and/or future graphs of many
+courses (or the whole catalog) to files, without the GUI.
+
+The catalog is loaded once in each worker process, and the graphs are built, laid out and
+written in parallel. For example, to export the prerequisite graphs of every course as HTML:
+
+    python batch_export.py all --kind prereq --format html --out maps
+"""
+
+from __future__ import annotations
+import argparse
+import importlib.util
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+from data_filtering import filter_courses
+from data_formatting import COURSES_FILE, get_courses_data
+from future_graph import future
+from instrumentation import request
+from prereq_graph import build_trace_graph
+from visualizing_graph import build_figure
+
+KINDS = ('prereq', 'future')
+FORMATS = ('html', 'svg', 'json')
+
+# the catalog and options of the current (worker) process, set up by init_worker
+_WORKER = {'courses': None, 'future_courses': None, 'out': '', 'formats': ()}
+
+
+def init_worker(path: str, out: str, formats: Sequence[str],
+                filters: Tuple[str, str, str]) -> None:
+    """Load the catalog and remember the export options in the current process.
+
+    filters is the (level, department, breadth) filter applied to future graphs, in the format
+    taken by filter_courses.
+    """
+    courses = get_courses_data(path)
+    _WORKER['courses'] = courses
+    _WORKER['future_courses'] = filter_courses(courses, *filters)
+    _WORKER['out'] = out
+    _WORKER['formats'] = tuple(formats)
+
+
+def export_graph(course: str, kind: str) -> Tuple[str, str, float, Optional[str]]:
+    """Build, lay out and write the graph of the given kind for course, using the catalog loaded
+    by init_worker. Return the course, the kind, the time taken in seconds and an error message
+    (None if the export succeeded).
+
+    Preconditions
+        - kind in KINDS
+    """
+    start = time.perf_counter()
+    try:
+        with request(f'export {kind} {course}'):
+            if kind == 'prereq':
+                graph = build_trace_graph(_WORKER['courses'], course)
+            else:
+                graph = future(_WORKER['future_courses'], course)
+            fig = build_figure(graph)
+            for file_format in _WORKER['formats']:
+                path = os.path.join(_WORKER['out'], f'{course}_{kind}.{file_format}')
+                if file_format == 'html':
+                    fig.write_html(path, include_plotlyjs='cdn')
+                elif file_format == 'json':
+                    fig.write_json(path)
+                else:
+                    fig.write_image(path)
+    except Exception as error:  # one broken course should not stop the whole export
+        return course, kind, time.perf_counter() - start, f'{type(error).__name__}: {error}'
+    return course, kind, time.perf_counter() - start, None
+
+
+def run_export(courses: Sequence[str], kinds: Sequence[str], formats: Sequence[str], out: str,
+               workers: int = 1, path: str = COURSES_FILE,
+               filters: Tuple[str, str, str] = ('', '', '')) -> Dict[str, float]:
+    """Export the graphs of the given kinds for every course in courses to the directory out,
+    printing progress as graphs are written. Return a summary of the export.
+
+    courses may contain 'all', which stands for every course in the catalog.
+    """
+    os.makedirs(out, exist_ok=True)
+    # compile (or load) the catalog up front, so that workers only ever load its snapshot
+    catalog = get_courses_data(path)
+    if 'all' in courses:
+        courses = list(catalog)
+    jobs = [(course, kind) for course in courses for kind in kinds]
+    init_args = (path, out, formats, filters)
+
+    start = time.perf_counter()
+    failures = 0
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=init_args) as executor:
+            futures = [executor.submit(export_graph, *job) for job in jobs]
+            for done, result in enumerate(as_completed(futures), start=1):
+                failures += _report(done, len(jobs), result.result())
+    else:
+        init_worker(*init_args)
+        for done, job in enumerate(jobs, start=1):
+            failures += _report(done, len(jobs), export_graph(*job))
+    seconds = time.perf_counter() - start
+
+    return {'graphs': len(jobs) - failures, 'failures': failures, 'seconds': seconds,
+            'graphs_per_second': (len(jobs) - failures) / seconds if seconds > 0 else 0.0}
+
+
+def _report(done: int, total: int, result: Tuple[str, str, float, Optional[str]]) -> int:
+    """Print the progress line of a finished export. Return 1 if the export failed, else 0."""
+    course, kind, seconds, error = result
+    status = f'failed ({error})' if error is not None else f'{seconds:.2f}s'
+    print(f'[{done}/{total}] {course} {kind}: {status}', file=sys.stderr)
+    return int(error is not None)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the batch export with the options given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('courses', nargs='+', help="course codes to export, or 'all'")
+    parser.add_argument('--kind', nargs='+', choices=KINDS, default=list(KINDS),
+                        help='which graphs to export (default: both)')
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['html'],
+                        help='file formats to write (default: html; svg needs kaleido)')
+    parser.add_argument('--out', default='export', help='output directory (default: export)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--catalog', default=COURSES_FILE, help='courses file to load')
+    parser.add_argument('--level', default='', help='level filter for future graphs, e.g. 3')
+    parser.add_argument('--department', default='', help='department filter for future graphs')
+    parser.add_argument('--breadth', default='', help='breadth filter for future graphs')
+    args = parser.parse_args(argv)
+
+    if 'svg' in args.format and importlib.util.find_spec('kaleido') is None:
+        # plotly needs kaleido to write images
+        parser.error('writing svg files needs the kaleido package (pip install kaleido)')
+
+    summary = run_export(args.courses, args.kind, args.format, args.out, args.workers,
+                         args.catalog, (args.level, args.department, args.breadth))
+    print(f"exported {summary['graphs']} graphs ({summary['failures']} failed) in "
+          f"{summary['seconds']:.1f}s: {summary['graphs_per_second']:.1f} graphs/sec")
+
+
+if __name__ == '__main__':
+    main()
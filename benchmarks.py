@@ -0,0 +1,613 @@
+"""CSC111 Project: University of Toronto Course Finder: Benchmarks
+
+Module Description:
+====================
+The module contains benchmarks for the hot paths of the course finder. Benchmarks run either on a
+real courses file or on a synthetic catalog, so they do not need any network access.
+
+Results can be written as JSON with --json and compared against an earlier run with --compare,
+so that regressions can be tracked across commits. Run `python benchmarks.py --help` for the
+available options.
+"""
+
+from __future__ import annotations
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import networkx as nx
+from PrereqTree_class import PrereqTree
+import course_search
+import data_formatting
+import prereq_graph
+from data_filtering import filter_courses
+from data_formatting import build_courses_data, get_courses_data
+from future_graph import future
+from graph_layout import clear_layout_cache, layout
+from visualizing_graph import build_figure
+
+DEPARTMENTS = ['ANT', 'BIO', 'CHM', 'CSC', 'ECO', 'ENG', 'GGR', 'HIS', 'MAT', 'PHL', 'PHY', 'POL',
+               'PSY', 'SOC', 'STA']
+BREADTHS = ['(1) Creative and Cultural Representation',
+            '(2) Thought, Belief and Behaviour',
+            '(3) Society and its Institutions',
+            '(4) Living Things and Their Environment',
+            '(5) The Physical and Mathematical Universes']
+# the filters timed by bench_filter, as (level, department, breadth)
+FILTERS = [('', '', ''), ('3', '', ''), ('', 'Department of CSC', ''), ('2', '', BREADTHS[4]),
+           ('4', 'Department of MAT', BREADTHS[4])]
+
+# the units of the times and sizes that are compared with a baseline: a result is compared if one
+# of the words of its name (separated by underscores) is a unit, such as 'us_per_item',
+# 'union_ms' or 'peak_mb', while counts and ratios such as 'items' or 'speedup_4' are not
+MEASURED_UNITS = {'seconds', 'ms', 'us', 'bytes', 'kb', 'mb'}
+# the max_depth limits bench_cycles builds graphs with, besides no limit at all
+CYCLE_DEPTHS = [1, 2]
+# the numbers of vertices of the graphs drawn by bench_render, which gives them twice as many edges
+RENDER_SIZES = [1000, 5000, 10000]
+
+# the longest acceptable time from starting the GUI to its window being drawn, in milliseconds
+STARTUP_TARGET_MS = 300
+# run in a new process by bench_startup, printing the time to import gui and to draw its window
+STARTUP_SCRIPT = '''
+import time
+start = time.perf_counter()
+import gui
+imported = time.perf_counter()
+try:
+    root = gui.build_app()
+    root.update()
+except gui.tk.TclError:  # there is no display to draw on
+    print(imported - start)
+else:
+    print(imported - start, time.perf_counter() - start)
+    root.destroy()
+'''
+
+# the catalogs compiled from the records benchmarked so far, keyed by the id of the records
+_CATALOGS = {}
+
+
+def synthetic_catalog(size: int, depth: int = 4, seed: int = 0) -> List[Dict]:
+    """Return a list of size course records in the format of courses.json, where requisite
+    chains are at most depth courses long. Requisite strings mix course lists, nested parentheses,
+    free text and courses from other campuses, like the academic calendar does.
+
+    Preconditions
+        - size >= 1
+        - depth >= 1
+    """
+    rng = random.Random(seed)
+    codes = set()
+    tiers = []  # tiers[i] is the list of codes of the courses which are i courses deep
+    for i in range(size):
+        tier = i * depth // size
+        if tier == len(tiers):
+            tiers.append([])
+        level = min(1 + tier * 4 // depth, 4)
+        code = _new_code(rng, codes, level)
+        codes.add(code)
+        tiers[tier].append(code)
+
+    records = []
+    for tier, tier_codes in enumerate(tiers):
+        pool = [code for lower in tiers[max(tier - 2, 0):tier] for code in lower]
+        for code in tier_codes:
+            records.append({
+                'code': code,
+                'name': f'Topics in {code[:3]} {code[3:6]}',
+                'description': 'A synthetic course. ' * 10,
+                'department': f'Department of {code[:3]}',
+                'arts_and_science_breadth': rng.choice(BREADTHS + [None]),
+                'prerequisites': _requisite_string(rng, pool) if pool else None,
+                'corequisites': rng.choice(pool) if pool and rng.random() < 0.1 else None,
+                'exclusions': None
+            })
+    rng.shuffle(records)
+    return records
+
+
+def _new_code(rng: random.Random, codes: set, level: int) -> str:
+    """Return a course code at the given level which is not in codes yet. Made up departments
+    are used once the real ones start running out of codes.
+    """
+    attempts = 0
+    while True:
+        if attempts < 20:
+            dept = rng.choice(DEPARTMENTS)
+        else:
+            dept = ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(3))
+        code = f'{dept}{level}{rng.randint(0, 99):02d}{rng.choice("HHY")}1'
+        if code not in codes:
+            return code
+        attempts += 1
+
+
+def _requisite_string(rng: random.Random, pool: List[str]) -> str:
+    """Return a random requisite string over the courses in pool."""
+    blocks = []
+    for _ in range(rng.randint(1, 4)):
+        options = rng.sample(pool, min(rng.randint(1, 4), len(pool)))
+        if rng.random() < 0.3:
+            # nested parenthetical with its own and(,) blocks
+            options[0] = '(' + ', '.join(rng.sample(pool, min(2, len(pool)))) + ')'
+        blocks.append('/ '.join(options))
+    prereq_str = '; '.join(blocks)
+    if rng.random() < 0.2:
+        prereq_str = f'60% or higher in {prereq_str}'
+    if rng.random() < 0.1:
+        prereq_str += ' (or equivalent), MAT135H5'
+    return prereq_str
+
+
+def load_catalog(path: Optional[str], size: int, depth: int) -> List[Dict]:
+    """Return the course records in path, or a synthetic catalog if path is None."""
+    if path is None:
+        return synthetic_catalog(size, depth)
+    with open(path) as json_data:
+        return json.load(json_data)
+
+
+def time_call(func: Callable[[], object], repeat: int,
+              setup: Optional[Callable[[], object]] = None) -> float:
+    """Return the best time in seconds out of repeat calls of func. If setup is given, it is
+    called before each call of func, without being timed.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_parse(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time parsing every requisite string in records with PrereqTree."""
+    strings = [course[key] for course in records for key in ('prerequisites', 'corequisites')
+               if course.get(key) is not None]
+    seconds = time_call(lambda: [PrereqTree(string) for string in strings], options.repeat)
+    return {'seconds': seconds, 'items': len(strings),
+            'us_per_item': seconds / max(len(strings), 1) * 1e6}
+
+
+def bench_memory(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Measure the memory held by the catalog built from records, and the peak memory used while
+    building it (options.repeat is ignored, memory usage does not vary between runs).
+    """
+    with catalog_file(records) as path:
+        gc.collect()
+        tracemalloc.start()
+        catalog = build_courses_data(path)
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'resident_mb': current / 1e6, 'peak_mb': peak / 1e6, 'items': len(catalog),
+            'bytes_per_item': current / max(len(catalog), 1)}
+
+
+def bench_ingest(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time building the catalog from records with 1 up to options.workers processes. The results
+    are the best time with each number of workers, and the speedup over a single worker.
+    """
+    result = {}
+    with catalog_file(records) as path:
+        for workers in range(1, options.workers + 1):
+            seconds = time_call(lambda: build_courses_data(path, workers), options.repeat)
+            result[f'seconds_{workers}'] = seconds
+            result[f'speedup_{workers}'] = result['seconds_1'] / seconds
+    return result
+
+
+def bench_build(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time get_courses_data when it compiles the catalog from scratch ('seconds_cold') and when it
+    loads the catalog from its snapshot ('seconds_snapshot').
+    """
+    with catalog_file(records) as path:
+        def cold() -> None:
+            data_formatting.clear_cache()
+            if os.path.exists(data_formatting.snapshot_path(path)):
+                os.remove(data_formatting.snapshot_path(path))
+            get_courses_data(path)
+
+        def snapshot() -> None:
+            data_formatting.clear_cache()
+            get_courses_data(path)
+
+        result = {'seconds_cold': time_call(cold, options.repeat),
+                  'seconds_snapshot': time_call(snapshot, options.repeat),
+                  'items': len(records)}
+        data_formatting.clear_cache()
+    return result
+
+
+def bench_filter(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time filter_courses with each of FILTERS, on a catalog whose indexes are already built."""
+    courses = compiled_catalog(records)
+    filter_courses(courses, '', '', '')
+    seconds = time_call(lambda: [len(filter_courses(courses, *filters)) for filters in FILTERS],
+                        options.repeat)
+    return {'seconds': seconds, 'items': len(FILTERS), 'us_per_item': seconds / len(FILTERS) * 1e6}
+
+
+def bench_search(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time building the search index ('index_ms'), completing the prefixes of a sample of
+    course codes ('us_per_completion') and searching for the codes with two characters swapped
+    ('us_per_typo'). 'typo_hits' is the share of misspelled codes whose course is found.
+    """
+    courses = compiled_catalog(records)
+    course_search.clear_cache()
+    index_seconds = time_call(lambda: course_search.build_search_index(courses), 1)
+    course_search.get_search_index(courses)
+    sample = sample_courses(courses, options.samples)
+    prefixes = [code[:length] for code in sample for length in range(1, len(code) + 1)]
+    typos = [code[:4] + code[5] + code[4] + code[6:] for code in sample]
+
+    completion = time_call(lambda: [course_search.complete(courses, prefix)
+                                    for prefix in prefixes], options.repeat)
+    typo = time_call(lambda: [course_search.search(courses, text) for text in typos],
+                     options.repeat)
+    hits = sum(code in course_search.search(courses, text) for code, text in zip(sample, typos))
+    return {'index_ms': index_seconds * 1e3, 'items': len(sample),
+            'us_per_completion': completion / len(prefixes) * 1e6,
+            'us_per_typo': typo / len(typos) * 1e6, 'typo_hits': hits / len(sample)}
+
+
+def bench_trace(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time building the global requisite graph ('graph_seconds'), and build_trace_graph for a
+    sample of courses with an empty trace cache ('us_per_item') and a full one
+    ('us_per_cached_item').
+    """
+    courses = compiled_catalog(records)
+    sample = sample_courses(courses, options.samples)
+
+    def graph() -> None:
+        prereq_graph.clear_cache()
+        prereq_graph.requisite_graph(courses)
+
+    def traces() -> None:
+        for course in sample:
+            prereq_graph.build_trace_graph(courses, course)
+
+    graph_seconds = time_call(graph, options.repeat)
+    # the trace cache is emptied by rebuilding the requisite graph before each run
+    seconds = time_call(traces, options.repeat, setup=graph)
+    cached = time_call(traces, options.repeat)
+    return {'graph_seconds': graph_seconds, 'items': len(sample),
+            'us_per_item': seconds / len(sample) * 1e6,
+            'us_per_cached_item': cached / len(sample) * 1e6}
+
+
+def bench_union(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time build_union_trace_graph for a sample of options.samples target courses
+    ('union_ms'), against composing their trace graphs built one by one ('compose_ms'), and
+    build_figure on the union graph with its layout already cached ('figure_ms').
+    """
+    courses = compiled_catalog(records)
+    sample = sample_courses(courses, options.samples)
+    prereq_graph.requisite_graph(courses)
+
+    def compose() -> None:
+        prereq_graph.clear_cache()
+        prereq_graph.requisite_graph(courses)
+        nx.compose_all([prereq_graph.build_trace_graph(courses, course) for course in sample])
+
+    union_seconds = time_call(lambda: prereq_graph.build_union_trace_graph(courses, sample),
+                              options.repeat)
+    compose_seconds = time_call(compose, 1)
+    union = prereq_graph.build_union_trace_graph(courses, sample)
+    build_figure(union)
+    figure_seconds = time_call(lambda: build_figure(union), options.repeat)
+    return {'items': len(sample), 'nodes': len(union), 'union_ms': union_seconds * 1e3,
+            'compose_ms': compose_seconds * 1e3, 'figure_ms': figure_seconds * 1e3}
+
+
+def bench_cycles(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time build_trace_graph and build_union_trace_graph on two courses of records made mutual
+    corequisites, as some real courses are, under no limit and with each of CYCLE_DEPTHS as
+    max_depth ('us_per_item').
+
+    Raise RuntimeError if a graph does not report the cycle, which a depth-limited graph only
+    finds through the edges out of vertices that were not expanded.
+    """
+    records = [dict(record) for record in records[:2]] + records[2:]
+    first, second = records[0]['code'], records[1]['code']
+    records[0]['corequisites'], records[1]['corequisites'] = second, first
+    with catalog_file(records) as path:
+        courses = build_courses_data(path)
+    prereq_graph.requisite_graph(courses)
+    limits = CYCLE_DEPTHS + [None]
+
+    def graphs() -> List[Tuple[Optional[int], nx.DiGraph]]:
+        return [(depth, graph) for depth in limits
+                for graph in (prereq_graph.build_trace_graph(courses, first, depth),
+                              prereq_graph.build_union_trace_graph(courses, [first], depth))]
+
+    for depth, graph in graphs():
+        if not any({first, second} <= set(cycle) for cycle in graph.graph['cycles']):
+            raise RuntimeError(f'the cycle of {first} and {second} is not reported with '
+                               f'max_depth={depth}')
+    seconds = time_call(graphs, options.repeat)
+    return {'items': len(limits) * 2, 'us_per_item': seconds / (len(limits) * 2) * 1e6}
+
+
+def bench_future(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time future for a sample of courses, over the whole catalog ('us_per_item') and over the
+    catalog filtered to one level ('us_per_filtered_item').
+    """
+    courses = compiled_catalog(records)
+    sample = sample_courses(courses, options.samples)
+    filtered = filter_courses(courses, '3', '', '')
+    seconds = time_call(lambda: [future(courses, course) for course in sample], options.repeat)
+    filtered_seconds = time_call(lambda: [future(filtered, course) for course in sample],
+                                 options.repeat)
+    return {'items': len(sample), 'us_per_item': seconds / len(sample) * 1e6,
+            'us_per_filtered_item': filtered_seconds / len(sample) * 1e6}
+
+
+def bench_connectives(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time remove_redundant_connectives on unsimplified trace graphs of a sample of courses,
+    which keep every connective of the requisite trees like convert_tree used to, and count the
+    vertices it removes ('removed_per_item').
+    """
+    courses = compiled_catalog(records)
+    graph = prereq_graph.requisite_graph(courses)
+    sample = sample_courses(courses, options.samples)
+    graphs = [unsimplified_graph(courses, [code for code in nx.descendants(graph, course) | {course}
+                                           if graph.nodes[code]['type'] == 'course'])
+              for course in sample]
+
+    best = float('inf')
+    for _ in range(options.repeat):
+        copies = [trace.copy() for trace in graphs]
+        start = time.perf_counter()
+        for trace in copies:
+            prereq_graph.remove_redundant_connectives(trace)
+        best = min(best, time.perf_counter() - start)
+    removed = sum(len(trace) for trace in graphs) - sum(len(trace) for trace in copies)
+    return {'seconds': best, 'items': len(graphs),
+            'nodes_per_item': sum(len(trace) for trace in graphs) / len(graphs),
+            'removed_per_item': removed / len(graphs),
+            'us_per_item': best / len(graphs) * 1e6}
+
+
+def unsimplified_graph(courses: Dict[str, Dict], codes: List[str]) -> nx.DiGraph:
+    """Return the union of the requisite trees of the courses codes, keeping a vertex for every
+    connective of the trees, even the redundant ones that convert_tree collapses.
+    """
+    graph = nx.DiGraph()
+    for code in codes:
+        graph.add_node(code, type='course', value=code)
+        for tree_type in ('prereq', 'coreq'):
+            tree = courses[code][tree_type + '_tree']
+            if tree is not None:
+                root = _add_unsimplified(graph, tree, tree_type, code, [0])
+                if root != '':
+                    graph.add_edge(code, root, edge_type=tree_type)
+    return graph
+
+
+def _add_unsimplified(graph: nx.DiGraph, tree: PrereqTree, tree_type: str, course: str,
+                      counter: List[int]) -> str:
+    """Add tree to graph with all of its connectives, see unsimplified_graph, and return the
+    label of its root ('' if it is an empty leaf). counter holds the number of connectives of
+    course labelled so far.
+    """
+    if tree.subtrees == []:
+        if tree.item != '':
+            graph.add_node(tree.item, type='course', value=tree.item)
+        return tree.item
+    label = f'{tree.item}_{course}_{tree_type}_{counter[0]}'
+    counter[0] += 1
+    graph.add_node(label, type='connective', value=tree.item)
+    for subtree in tree.subtrees:
+        root = _add_unsimplified(graph, subtree, tree_type, course, counter)
+        if root != '':
+            graph.add_edge(label, root, edge_type=tree_type)
+    return label
+
+
+def bench_figure(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time build_figure on the trace and future graphs of a sample of options.figures courses,
+    computing their layouts ('ms_per_item') and with their layouts cached
+    ('ms_per_cached_item').
+    """
+    courses = compiled_catalog(records)
+    sample = sample_courses(courses, options.figures)
+    graphs = [prereq_graph.build_trace_graph(courses, course) for course in sample] \
+        + [future(courses, course) for course in sample]
+
+    def figures() -> None:
+        clear_layout_cache()
+        for graph in graphs:
+            build_figure(graph)
+
+    seconds = time_call(figures, options.repeat)
+    cached = time_call(lambda: [build_figure(graph) for graph in graphs], options.repeat)
+    return {'items': len(graphs), 'nodes_per_item': sum(map(len, graphs)) / len(graphs),
+            'ms_per_item': seconds / len(graphs) * 1e3,
+            'ms_per_cached_item': cached / len(graphs) * 1e3}
+
+
+def bench_render(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time build_figure drawing synthetic graphs of each of RENDER_SIZES vertices with SVG
+    ('ms_svg_<size>') and with WebGL ('ms_gl_<size>'), with their layouts already cached, and
+    measure the size of the figures sent to the browser in kilobytes ('kb_svg_<size>' and
+    'kb_gl_<size>'). The catalog is not used.
+    """
+    result = {}
+    for size in RENDER_SIZES:
+        graph = synthetic_graph(size)
+        layout(graph)
+        for name, webgl in (('svg', False), ('gl', True)):
+            seconds = time_call(lambda: build_figure(graph, webgl), options.repeat)
+            result[f'ms_{name}_{size}'] = seconds * 1e3
+            result[f'kb_{name}_{size}'] = len(build_figure(graph, webgl).to_json()) / 1e3
+    return result
+
+
+def synthetic_graph(size: int, seed: int = 0) -> nx.DiGraph:
+    """Return a random acyclic graph shaped like the graphs that are drawn, with size vertices
+    (a few of them searched courses) and twice as many edges of both types.
+    """
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    for i in range(size):
+        graph.add_node(i, type='course', value=f'{rng.choice(DEPARTMENTS)}{i:05}H1',
+                       tag='original' if i % 100 == 0 else 'other')
+    for i in range(1, size):
+        for tail in rng.sample(range(i), min(i, 2)):
+            graph.add_edge(tail, i, edge_type=rng.choice(['prereq', 'coreq']))
+    return graph
+
+
+def bench_startup(records: List[Dict], options: argparse.Namespace) -> Dict[str, float]:
+    """Time a cold start of the GUI in a new process: importing gui ('import_ms') and drawing its
+    main window for the first time ('first_paint_ms', only measured when there is a display),
+    against STARTUP_TARGET_MS. The catalog is loaded from records in the background.
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    imports, paints = [], []
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, data_formatting.COURSES_FILE), 'w') as json_data:
+            json.dump(records, json_data)
+        for _ in range(options.repeat):
+            output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=directory,
+                                    env={**os.environ, 'PYTHONPATH': package},
+                                    capture_output=True, text=True, check=True).stdout.split()
+            imports.append(float(output[0]))
+            paints.extend(float(seconds) for seconds in output[1:])
+
+    result = {'import_ms': min(imports) * 1e3, 'target_ms': STARTUP_TARGET_MS}
+    if paints:
+        result['first_paint_ms'] = min(paints) * 1e3
+    return result
+
+
+def compiled_catalog(records: List[Dict]) -> Dict[str, Dict]:
+    """Return the catalog compiled from records, compiling it only once."""
+    if id(records) not in _CATALOGS:
+        with catalog_file(records) as path:
+            _CATALOGS[id(records)] = build_courses_data(path)
+    return _CATALOGS[id(records)]
+
+
+def sample_courses(courses: Dict[str, Dict], size: int) -> List[str]:
+    """Return the same random sample of size course codes of courses on every run."""
+    return random.Random(0).sample(sorted(courses), min(size, len(courses)))
+
+
+@contextlib.contextmanager
+def catalog_file(records: List[Dict]) -> Iterator[str]:
+    """Write records to a temporary courses file and yield its path. The file (and any catalog
+    snapshot of it) is removed afterwards.
+    """
+    handle, path = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(handle, 'w') as json_data:
+            json.dump(records, json_data)
+        yield path
+    finally:
+        for leftover in (path, path + '.pickle'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'memory': bench_memory,
+    'ingest': bench_ingest,
+    'build': bench_build,
+    'filter': bench_filter,
+    'search': bench_search,
+    'trace': bench_trace,
+    'union': bench_union,
+    'cycles': bench_cycles,
+    'future': bench_future,
+    'connectives': bench_connectives,
+    'figure': bench_figure,
+    'render': bench_render,
+    'startup': bench_startup
+}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the benchmarks selected on the command line and print their results."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--catalog', help='courses file to benchmark on (default: synthetic)')
+    parser.add_argument('--size', type=int, default=3000, help='synthetic catalog size')
+    parser.add_argument('--depth', type=int, default=4, help='synthetic requisite depth')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per benchmark (best is kept)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='maximum number of worker processes (default: number of cores)')
+    parser.add_argument('--samples', type=int, default=200,
+                        help='courses sampled by the trace, future and connectives benchmarks')
+    parser.add_argument('--figures', type=int, default=5,
+                        help='courses sampled by the figure benchmark')
+    parser.add_argument('--json', metavar='PATH', help='also write the results to PATH as JSON')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare the results with an earlier run written with --json')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f'benchmarks to run, out of {", ".join(BENCHMARKS)} (default: all)')
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name!r}')
+
+    baseline = {}
+    if args.compare is not None:
+        with open(args.compare) as earlier:
+            baseline = json.load(earlier)['results']
+
+    records = load_catalog(args.catalog, args.size, args.depth)
+    results = {}
+    for name in args.benchmarks or list(BENCHMARKS):
+        result = BENCHMARKS[name](records, args)
+        results[name] = result
+        print(f'{name:>11}: ' + ', '.join(f'{key}={value:.6g}' for key, value in result.items()))
+        for key, change in compare(result, baseline.get(name, {})).items():
+            print(f'{"":>11}  {key}: {change:+.1%} vs baseline')
+
+    if args.json is not None:
+        with open(args.json, 'w') as output:
+            json.dump({'meta': run_metadata(args), 'results': results}, output, indent=2)
+
+
+def compare(result: Dict[str, float], baseline: Dict[str, float]) -> Dict[str, float]:
+    """Return the relative change of each measurement in result from the same measurement in
+    baseline, see MEASURED_UNITS.
+    """
+    return {key: value / baseline[key] - 1 for key, value in result.items()
+            if key in baseline and baseline[key] > 0
+            and not MEASURED_UNITS.isdisjoint(key.split('_'))}
+
+
+def run_metadata(options: argparse.Namespace) -> Dict:
+    """Return what is needed to reproduce and compare a benchmark run: the options, the commit
+    benchmarked (None outside a git checkout), and the Python version and platform.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'options': {key: value for key, value in vars(options).items()
+                        if key not in ('json', 'compare')}}
+
+
+if __name__ == '__main__':
+    main()
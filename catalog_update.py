@@ -0,0 +1,56 @@
+"""CSC111 Project: University of Toronto Course Finder: Catalog Updates
+
+Module Description:
+====================
+The module contains the code that applies a corrected courses file to a loaded catalog
+incrementally, instead of rebuilding the catalog and everything computed from it.
+
+The new records are diffed against the catalog and only the changed requisite strings are parsed
+again. The 'required_by' lists, the filtering indexes and the global requisite graph are then
+patched in place, and only the cached trace graphs that contain a changed course are forgotten.
+The compiled eligibility program and the search index are rebuilt on next use. Cached layouts
+need no invalidation, since they are keyed by the contents of the graphs.
+"""
+
+from typing import Dict, List, Sequence, Union
+import course_search
+import eligibility
+from data_filtering import update_indexes
+from data_formatting import COURSES_FILE, update_courses_data
+from prereq_graph import update_requisite_graph
+
+
+def update_catalog(courses: dict, path: Union[str, Sequence[str]] = COURSES_FILE
+                   ) -> Dict[str, List[str]]:
+    """Mutate the catalog courses, as returned by get_courses_data, to match the given courses
+    file(s), and patch the indexes and graphs built from it. Return the sorted codes of the
+    'added', 'removed' and 'changed' courses.
+    """
+    changes = update_courses_data(courses, path)
+    update_indexes(courses, changes)
+    update_requisite_graph(courses, changes)
+    if changes:
+        eligibility.clear_cache()
+        course_search.clear_cache()
+
+    summary = {'added': [], 'removed': [], 'changed': []}
+    for code, (old, new) in sorted(changes.items()):
+        if old is None:
+            summary['added'].append(code)
+        elif new is None:
+            summary['removed'].append(code)
+        else:
+            summary['changed'].append(code)
+    return summary
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['course_search', 'eligibility', 'data_filtering', 'data_formatting',
+                          'prereq_graph'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -0,0 +1,308 @@
+"""CSC111 Project: University of Toronto Course Finder: Course Search
+
+Module Description:
+====================
+The module contains the search index over the course codes and names of a catalog, which serves
+as-you-type completion and typo-tolerant lookup for the GUI and the query service.
+
+Codes and the words of course names are kept as a sorted vocabulary of terms, so that all the
+terms starting with a prefix are a contiguous range found by binary search (a flattened prefix
+trie), and every term maps to the bitset of the courses that contain it. Terms are also indexed by
+their trigrams, so that a misspelled word or code can be matched to the terms that share the most
+trigrams with it. The index is built once per catalog, like the indexes of data_filtering.
+"""
+
+from __future__ import annotations
+import bisect
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from data_filtering import bit_positions
+
+# the number of results returned by default
+RESULT_LIMIT = 10
+# the number of terms sharing the most trigrams with a misspelled query word that are compared
+# with it (as well as as many terms around it in alphabetical order), the smallest similarity
+# (from 0 to 1, by edit distance) of those that match it, and the most terms it matches
+FUZZY_CANDIDATES = 24
+FUZZY_THRESHOLD = 0.5
+FUZZY_TERMS = 10
+# the share of the terms above which a trigram is ignored when matching misspelled words
+COMMON_TRIGRAM = 0.05
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# the search index of the catalog it was built from
+_STATE = {'courses': None, 'index': None}
+
+
+def get_search_index(courses: Dict[str, Dict]) -> Dict:
+    """Return the search index of the catalog courses, building it if it does not exist yet. The
+    index is a dictionary with the following keys:
+        - 'codes': the list of course codes, in catalog order; bitsets refer to their positions
+        - 'keys': the lowercase course codes, sorted, and 'key_codes' the codes they belong to
+        - 'terms': the sorted distinct terms of the catalog, i.e. the lowercase codes and the
+            words of the course names
+        - 'postings': the bitset of the courses containing each term, in the order of 'terms'
+        - 'trigrams': a dictionary mapping each trigram to the positions in 'terms' of the terms
+            that contain it
+    """
+    if _STATE['courses'] is not courses:
+        _STATE['index'] = build_search_index(courses)
+        _STATE['courses'] = courses
+    return _STATE['index']
+
+
+def build_search_index(courses: Dict[str, Dict]) -> Dict:
+    """Return a new search index of the catalog courses, see get_search_index."""
+    codes = list(courses)
+    keys = sorted((code.lower(), code) for code in codes)
+    postings = {}
+    for position, code in enumerate(codes):
+        bit = 1 << position
+        for term in {code.lower(), *words(courses[code].get('name') or '')}:
+            postings[term] = postings.get(term, 0) | bit
+
+    terms = sorted(postings)
+    trigrams = {}
+    for term_id, term in enumerate(terms):
+        for trigram in set(term_trigrams(term)):
+            trigrams.setdefault(trigram, []).append(term_id)
+    return {'codes': codes, 'keys': [key for key, _ in keys],
+            'key_codes': [code for _, code in keys], 'terms': terms,
+            'postings': [postings[term] for term in terms], 'trigrams': trigrams}
+
+
+def clear_cache() -> None:
+    """Forget the search index, so that it is rebuilt on next use."""
+    _STATE['courses'] = None
+    _STATE['index'] = None
+
+
+def words(text: str) -> List[str]:
+    """Return the lowercase words of text, ignoring punctuation."""
+    return _WORD.findall(text.lower())
+
+
+def term_trigrams(term: str) -> List[str]:
+    """Return the trigrams of term, padded so that terms of two characters have a trigram too
+    and that the start and end of a term count for more.
+    """
+    padded = f'${term}$'
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def complete(courses: Dict[str, Dict], text: str, limit: int = RESULT_LIMIT) -> List[str]:
+    """Return the codes of up to limit courses that text is the start of: first the courses whose
+    code starts with text (ignoring case and spaces), then the courses with a word in their name
+    starting with each word of text.
+    """
+    index = get_search_index(courses)
+    query = words(text)
+    if query == [] or limit <= 0:
+        return []
+    results = _code_prefix(index, ''.join(query), limit)
+    if len(results) < limit:
+        bits = _all_words(index, [_prefix_bits(index, word) for word in query])
+        _add_positions(index, bits, results, limit)
+    return list(results)
+
+
+def search(courses: Dict[str, Dict], text: str, limit: int = RESULT_LIMIT) -> List[str]:
+    """Return the codes of up to limit courses matching text, best first. The completions of
+    text come first (see complete), followed by the courses whose codes or names are closest to
+    text when it is misspelled.
+    """
+    results = dict.fromkeys(complete(courses, text, limit))
+    query = words(text)
+    if len(results) >= limit or query == []:
+        return list(results)
+
+    index = get_search_index(courses)
+    # the words of text, or a code typed with spaces in it, such as 'csc 236 h1'
+    readings = [query, [''.join(query)]] if len(query) > 1 else [query]
+    scores = {}
+    for reading in readings:
+        for position, score in _fuzzy_matches(index, reading, limit):
+            scores[position] = max(score, scores.get(position, 0.0))
+    for position in sorted(scores, key=lambda p: (-scores[p], p)):
+        if len(results) >= limit:
+            break
+        results.setdefault(index['codes'][position])
+    return list(results)
+
+
+def resolve(courses: Dict[str, Dict], text: str) -> Optional[str]:
+    """Return the code of the course that text names exactly, ignoring case and spaces, or that
+    text starts with (such as a completion of the form 'CSC263H1 Data Structures ...'). Return
+    None if there is no such course.
+    """
+    query = words(text)
+    if query == []:
+        return None
+    index = get_search_index(courses)
+    for candidate in (''.join(query), query[0]):
+        position = bisect.bisect_left(index['keys'], candidate)
+        if position < len(index['keys']) and index['keys'][position] == candidate:
+            return index['key_codes'][position]
+    return None
+
+
+def edit_distance(first: str, second: str) -> float:
+    """Return the number of characters to insert, delete or replace to turn first into second,
+    where swapping two adjacent characters counts as half a change, since it is the most common
+    typo (a weighted optimal string alignment distance).
+    """
+    # a common prefix or suffix never needs editing, and codes often share long ones
+    start = 0
+    while start < min(len(first), len(second)) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < min(len(first), len(second)) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first, second = first[start:len(first) - end], second[start:len(second) - end]
+
+    before, previous = [], list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            distance = previous[j - 1] if char == other else previous[j - 1] + 1
+            if previous[j] + 1 < distance:
+                distance = previous[j] + 1
+            if current[j - 1] + 1 < distance:
+                distance = current[j - 1] + 1
+            if j > 1 and i > 1 and char == second[j - 2] and first[i - 2] == other \
+                    and before[j - 2] + 0.5 < distance:
+                distance = before[j - 2] + 0.5
+            current.append(distance)
+        before, previous = previous, current
+    return previous[-1]
+
+
+def describe(courses: Dict[str, Dict], code: str) -> str:
+    """Return the code and name of the course code, as shown in lists of results."""
+    name = courses[code].get('name')
+    return f'{code} {name}' if name else code
+
+
+def sum_bits(bitsets: Iterable[int]) -> int:
+    """Return the union of the given bitsets."""
+    bits = 0
+    for bitset in bitsets:
+        bits |= bitset
+    return bits
+
+
+def _code_prefix(index: Dict, prefix: str, limit: int) -> Dict[str, None]:
+    """Return the codes of up to limit courses whose lowercase code starts with prefix, in
+    order, as the keys of a dictionary.
+    """
+    keys = index['keys']
+    results = {}
+    position = bisect.bisect_left(keys, prefix)
+    while position < len(keys) and len(results) < limit and keys[position].startswith(prefix):
+        results[index['key_codes'][position]] = None
+        position += 1
+    return results
+
+
+def _prefix_bits(index: Dict, prefix: str) -> int:
+    """Return the bitset of the courses containing a term that starts with prefix."""
+    terms = index['terms']
+    start = bisect.bisect_left(terms, prefix)
+    # every term starting with prefix sorts before prefix followed by the largest character
+    end = bisect.bisect_left(terms, prefix + '\uffff', start)
+    return sum_bits(index['postings'][start:end])
+
+
+def _fuzzy_matches(index: Dict, query: List[str], limit: int) -> List[Tuple[int, float]]:
+    """Return the positions of up to limit courses with a term close to every word in query,
+    with their average similarity to the words. The courses closest to the first word are
+    taken first.
+    """
+    tiers = [_fuzzy_tiers(index, word) for word in query]
+    bits = _all_words(index, [sum_bits(tier_bits for _, tier_bits in word_tiers)
+                              for word_tiers in tiers])
+    matches = []
+    for _, first_bits in tiers[0]:
+        for position in bit_positions(first_bits & bits):
+            if len(matches) >= limit:
+                return matches
+            score = sum(max(similarity for similarity, tier_bits in word_tiers
+                            if (tier_bits >> position) & 1) for word_tiers in tiers)
+            matches.append((position, score / len(query)))
+        bits &= ~first_bits
+    return matches
+
+
+def _fuzzy_tiers(index: Dict, word: str) -> List[Tuple[float, int]]:
+    """Return the similarities of the terms closest to word, each with the bitset of the courses
+    containing a term that similar, from the most to the least similar.
+
+    The terms sharing the most trigrams with word, the terms next to it in alphabetical order
+    (which catch typos near the end of word) and word with two characters swapped are ranked by
+    their edit distance to word.
+    """
+    shared = Counter()
+    for trigram in set(term_trigrams(word)):
+        term_ids = index['trigrams'].get(trigram, ())
+        # trigrams shared by a large part of the terms, such as 'h1$', tell them apart poorly
+        if len(term_ids) <= len(index['terms']) * COMMON_TRIGRAM:
+            shared.update(term_ids)
+    candidates = {term_id for term_id, _ in shared.most_common(FUZZY_CANDIDATES)}
+    terms = index['terms']
+    middle = bisect.bisect_left(terms, word)
+    candidates.update(range(max(middle - FUZZY_CANDIDATES // 2, 0),
+                            min(middle + FUZZY_CANDIDATES // 2, len(terms))))
+    for i in range(len(word) - 1):
+        # swapped characters are the most common typo, and are looked up directly
+        swapped = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        term_id = bisect.bisect_left(terms, swapped)
+        if term_id < len(terms) and terms[term_id] == swapped:
+            candidates.add(term_id)
+
+    closest = []
+    for term_id in candidates:
+        term = terms[term_id]
+        longest = max(len(word), len(term))
+        if abs(len(word) - len(term)) > longest * (1 - FUZZY_THRESHOLD):
+            # the edit distance is at least the difference in length
+            continue
+        similarity = 1 - edit_distance(word, term) / longest
+        if similarity >= FUZZY_THRESHOLD:
+            closest.append((similarity, term_id))
+    closest.sort(reverse=True)
+
+    tiers = {}
+    for similarity, term_id in closest[:FUZZY_TERMS]:
+        tiers[similarity] = tiers.get(similarity, 0) | index['postings'][term_id]
+    return list(tiers.items())
+
+
+def _all_words(index: Dict, bitsets: List[int]) -> int:
+    """Return the bitset of the courses in all of bitsets, i.e. matching every query word."""
+    bits = (1 << len(index['codes'])) - 1
+    for bitset in bitsets:
+        bits &= bitset
+    return bits
+
+
+def _add_positions(index: Dict, bits: int, results: Dict[str, None], limit: int) -> None:
+    """Add the codes of the courses in bits to results, in catalog order, until there are limit
+    results.
+    """
+    for position in bit_positions(bits):
+        if len(results) >= limit:
+            return
+        results.setdefault(index['codes'][position])
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['bisect', 're', 'collections', 'data_filtering'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -4,61 +4,222 @@ Module Description:
 ====================
 The module contains the code that will filter the courses based on courses taken in the past,
 breadth, department and level.
+
+Filtering is backed by inverted indexes from each breadth category, level and department to the
+set of matching courses, stored as a bitset over the positions of the courses in the catalog.
+Filters are combined with bitwise operations and return a CourseView, a read-only mapping that
+shares the course dictionaries of the catalog instead of copying them.
 """
 
-from typing import Dict
+from __future__ import annotations
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# placeholder values of the GUI's comboboxes, which mean that nothing is filtered out
+BREADTH_PLACEHOLDERS = {'Pick a breadth category', ''}
+LEVEL_PLACEHOLDERS = {'Pick a level', 'P', ''}
+DEPARTMENT_PLACEHOLDERS = {'Pick a department', ''}
+
+# the indexes of the catalog they were built from
+_STATE = {'courses': None, 'indexes': None}
+
+
+class CourseView(Mapping):
+    """A read-only view of the courses of a catalog that are in a bitset.
+
+    Instance Attributes:
+        - catalog: the full catalog, mapping course codes to course dictionaries
+        - bits: the bitset of the positions of the courses in the view
+        - indexes: the indexes of catalog that bits refers to, see get_indexes
+
+    Representation Invariants:
+        - self.bits >= 0
+    """
+    catalog: Dict[str, Dict]
+    bits: int
+    indexes: Dict
+
+    def __init__(self, catalog: Dict[str, Dict], bits: int,
+                 indexes: Optional[Dict] = None) -> None:
+        self.catalog = catalog
+        self.bits = bits
+        # kept, so that the positions in bits stay valid if another catalog is indexed later
+        self.indexes = get_indexes(catalog) if indexes is None else indexes
+
+    def __getitem__(self, code: str) -> Dict:
+        if code not in self:
+            raise KeyError(code)
+        return self.catalog[code]
+
+    def __contains__(self, code: object) -> bool:
+        position = self.indexes['positions'].get(code)
+        return position is not None and (self.bits >> position) & 1 == 1
+
+    def __iter__(self) -> Iterator[str]:
+        codes = self.indexes['codes']
+        for position in bit_positions(self.bits):
+            yield codes[position]
+
+    def __len__(self) -> int:
+        return bin(self.bits).count('1')
+
+
+def bit_positions(bits: int) -> Iterator[int]:
+    """Yield the positions of the bits set in bits, in increasing order."""
+    # scan the binary representation from the least significant bit onwards
+    digits = bin(bits)[:1:-1]
+    position = digits.find('1')
+    while position != -1:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+def get_indexes(courses: Dict[str, Dict]) -> Dict:
+    """Return the inverted indexes of the catalog courses, building them if they do not exist yet.
+    The indexes are a dictionary with the following keys:
+        - 'codes': the list of course codes, in catalog order
+        - 'positions': a dictionary mapping each course code to its position in 'codes'
+        - 'all': the bitset of all courses
+        - 'breadth', 'level', 'department': dictionaries mapping each (raw) breadth, level and
+            department value to the bitset of the courses that have it
+    """
+    if _STATE['courses'] is not courses:
+        indexes = {'codes': list(courses), 'positions': {}, 'all': 0,
+                   'breadth': {}, 'level': {}, 'department': {}}
+        for position, code in enumerate(indexes['codes']):
+            indexes['positions'][code] = position
+            indexes['all'] |= 1 << position
+            for key, value in _indexed_values(code, courses[code]):
+                indexes[key][value] = indexes[key].get(value, 0) | 1 << position
+        _STATE['courses'] = courses
+        _STATE['indexes'] = indexes
+    return _STATE['indexes']
+
 
+def update_indexes(courses: Dict[str, Dict],
+                   changes: Dict[str, Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+    """Patch the indexes of courses in place to account for changes, in the format returned by
+    data_formatting.update_courses_data. Does nothing if the indexes of courses have not been
+    built.
 
-def breadth(br: str, courses: Dict) -> Dict:
-    """Return a list of course titles of all the courses that satisfy the br breadth requirement.
+    Removed courses keep their position in 'codes' so that the positions of the other courses do
+    not change, and added courses are given new positions at the end. Views taken before the update
+    still use the bitsets from before it.
     """
-    if br in {'Pick a breadth category', ''}:
-        return courses
-    new_courses = {}
-    for course in courses:
-        if courses[course]['arts_and_science_breadth'] is not None and \
-                br in courses[course]['arts_and_science_breadth']:
-            new_courses[course] = courses[course]
-    return new_courses
-
-
-def level(lev: str, courses: Dict) -> Dict:
-    """Return a list of course titles of all the courses that are at the lvl level."""
-    if lev in {'Pick a level', 'P', ''}:
-        return courses
-    new_courses = {}
-    for course in courses:
-        if course[3] == str(lev):
-            new_courses[course] = courses[course]
-    return new_courses
-
-
-def department(dept: str, courses: Dict) -> Dict:
-    """Return a list of course titles of all the courses that are from dept department. """
-    if dept in {'Pick a department', ''}:
-        return courses
-    new_courses = {}
-    for course in courses:
-        if courses[course]['department'] != dept:
-            new_courses[course] = courses[course]
-    return new_courses
-
-
-def filter_courses(courses: Dict, lvl: str, dept: str, br: str) -> Dict:
-    """Return a dictionary that has all the courses filtered by the specified level, department
+    if _STATE['courses'] is not courses:
+        return
+    indexes = _STATE['indexes']
+    for code, (old, new) in changes.items():
+        position = indexes['positions'].get(code)
+        if old is not None and position is not None:
+            bit = 1 << position
+            indexes['all'] &= ~bit
+            for key, value in _indexed_values(code, old):
+                indexes[key][value] &= ~bit
+                if indexes[key][value] == 0:
+                    del indexes[key][value]
+        if new is None:
+            indexes['positions'].pop(code, None)
+            continue
+
+        if position is None:
+            position = len(indexes['codes'])
+            indexes['codes'].append(code)
+            indexes['positions'][code] = position
+        bit = 1 << position
+        indexes['all'] |= bit
+        for key, value in _indexed_values(code, new):
+            indexes[key][value] = indexes[key].get(value, 0) | bit
+
+
+def _indexed_values(code: str, course: Dict) -> List[Tuple[str, Optional[str]]]:
+    """Return the index names and values that course is indexed under."""
+    return [('breadth', course.get('arts_and_science_breadth')), ('level', code[3]),
+            ('department', course.get('department'))]
+
+
+def select(courses: Union[Dict[str, Dict], CourseView],
+           breadths: Iterable[str] = (), levels: Iterable[str] = (),
+           departments: Iterable[str] = (), exclude_breadths: Iterable[str] = (),
+           exclude_levels: Iterable[str] = (), exclude_departments: Iterable[str] = ()
+           ) -> CourseView:
+    """Return a view of the courses that satisfy all of the given filters. A course satisfies
+    the breadths filter if it belongs to any of the given breadth categories, and likewise for
+    levels and departments; an empty filter is satisfied by every course. A course must also
+    belong to none of the excluded breadth categories, levels and departments.
+
+    courses is either a full catalog or a view of one, in which case only courses in the view are
+    selected.
+    """
+    if isinstance(courses, CourseView):
+        catalog, bits, indexes = courses.catalog, courses.bits, courses.indexes
+    else:
+        catalog = courses
+        indexes = get_indexes(catalog)
+        bits = indexes['all']
+
+    for key, values in (('breadth', breadths), ('level', levels), ('department', departments)):
+        values = set(values)
+        if values:
+            bits &= _matching(indexes, key, values)
+    for key, values in (('breadth', exclude_breadths), ('level', exclude_levels),
+                        ('department', exclude_departments)):
+        values = set(values)
+        if values:
+            bits &= ~_matching(indexes, key, values)
+    return CourseView(catalog, bits, indexes)
+
+
+def _matching(indexes: Dict, key: str, values: set) -> int:
+    """Return the bitset of the courses whose key matches any of values. Breadth categories match
+    every raw breadth value they appear in, since a course can satisfy several categories.
+    """
+    bits = 0
+    for value, value_bits in indexes[key].items():
+        if value is None:
+            continue
+        if key == 'breadth':
+            matches = any(br in value for br in values)
+        else:
+            matches = value in values
+        if matches:
+            bits |= value_bits
+    return bits
+
+
+def breadth(br: str, courses: Dict) -> CourseView:
+    """Return a view of all the courses that satisfy the br breadth requirement."""
+    if br in BREADTH_PLACEHOLDERS:
+        return select(courses)
+    return select(courses, breadths=[br])
+
+
+def level(lev: str, courses: Dict) -> CourseView:
+    """Return a view of all the courses that are at the lev level."""
+    if lev in LEVEL_PLACEHOLDERS:
+        return select(courses)
+    return select(courses, levels=[str(lev)])
+
+
+def department(dept: str, courses: Dict) -> CourseView:
+    """Return a view of all the courses that are from dept department. """
+    if dept in DEPARTMENT_PLACEHOLDERS:
+        return select(courses)
+    return select(courses, departments=[dept])
+
+
+def filter_courses(courses: Dict, lvl: str, dept: str, br: str) -> CourseView:
+    """Return a view of all the courses filtered by the specified level, department
     and/or breadth requirement.
     """
-    course1 = breadth(br, courses)
-    course2 = level(lvl, course1)
-    course3 = department(dept, course2)
-    return course3
+    return department(dept, level(lvl, breadth(br, courses)))
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': [],
+        'extra-imports': ['collections.abc'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['E1136']
@@ -7,35 +7,399 @@ course represented as a dictionary.
 """
 
 from __future__ import annotations
-from typing import Tuple, Dict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Tuple, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TextIO, \
+    Union
+import itertools
 import json
+import os
+import pickle
+import sys
+import zlib
 import networkx as nx
 from PrereqTree_class import PrereqTree
+from instrumentation import count, timed
 
+COURSES_FILE = 'courses.json'
+# bump whenever the structure of the compiled catalog changes so that stale snapshots are rebuilt
+SNAPSHOT_VERSION = 4
+# the fields of the raw course records that are kept in the catalog
+COURSE_FIELDS = ('code', 'name', 'department', 'arts_and_science_breadth', 'prerequisites',
+                 'corequisites')
+# the fields added to each course when the catalog is compiled
+DERIVED_FIELDS = ('prereq_tree', 'coreq_tree', 'required_by')
 
-def get_courses_data() -> dict:
-    """Return a dictionary of course data from the courses.json file. Two new key-value pairs are
-    added; 'prereq_tree' and 'coreq_tree'. The value for each key is a tree generated based on the
-    string of prerequisites and corequisites respectively.
+# number of characters read at a time when streaming a courses file
+READ_SIZE = 1 << 16
+# number of courses sent to a worker process at a time when compiling in parallel
+PARALLEL_CHUNK_SIZE = 256
+
+# process-wide compiled catalogs, keyed by tuples of source paths, as (fingerprint, catalog) pairs
+_CATALOGS = {}
+
+
+@timed('catalog.load')
+def get_courses_data(path: Union[str, Sequence[str]] = COURSES_FILE, workers: int = 1) -> dict:
+    """Return a dictionary of course data from the courses.json file. Only the COURSE_FIELDS of
+    each course are kept, and three new key-value pairs are added; 'prereq_tree' and 'coreq_tree'
+    are PrereqTrees parsed from the string of prerequisites and corequisites respectively, and
+    'required_by' is the list of the codes of all courses that have this course in their
+    prerequisite tree. Use tree_graph to get the requisite trees as networkx graphs.
+
+    path can also be a sequence of courses files (e.g. one for each campus or year), which are
+    combined into one catalog. Courses in later files replace courses with the same code in
+    earlier ones.
+
+    The compiled catalog is kept in memory for the rest of the process and snapshotted to disk
+    next to the source file, so it is only rebuilt when the source file changes. When it is
+    rebuilt, it is compiled by as many processes as workers (see build_courses_data).
     """
-    json_data = open('courses.json')
-    data = json.load(json_data)
+    paths = _as_paths(path)
+    fingerprint = _fingerprint(paths)
+    cached = _CATALOGS.get(paths)
+    if cached is not None and cached[0] == fingerprint:
+        count('catalog.memory_hits')
+        return cached[1]
+
+    data_dict = _load_snapshot(paths, fingerprint)
+    if data_dict is not None:
+        count('catalog.snapshot_hits')
+    else:
+        data_dict = build_courses_data(paths, workers)
+        _save_snapshot(paths, fingerprint, data_dict)
+
+    _CATALOGS[paths] = (fingerprint, data_dict)
+    return data_dict
+
+
+@timed('catalog.build')
+def build_courses_data(path: Union[str, Sequence[str]] = COURSES_FILE, workers: int = 1,
+                       fields: Optional[Sequence[str]] = COURSE_FIELDS) -> dict:
+    """Parse the given courses file(s) into a dictionary of course data, bypassing every cache.
+    See get_courses_data for the format of the returned dictionary. Only the given fields of the
+    raw courses are kept, or all of them if fields is None.
+
+    The files are streamed one course at a time, so memory use does not grow with the size of the
+    raw files, only with the size of the compiled catalog.
+
+    If workers > 1, the courses are split into chunks which are compiled in a pool of that many
+    processes. The result is exactly the same as with a single worker.
+    """
+    data = (course for source in _as_paths(path) for course in iter_courses(source, fields))
+    if workers > 1:
+        compiled = _compile_parallel(data, workers)
+    else:
+        compiled = (compile_course(course) for course in data)
+
     data_dict = {}
-    for course in data:
-        if 'prerequisites' not in course or course['prerequisites'] is None:
-            course['prereq_tree'] = None
+    for course in compiled:
+        data_dict[course['code']] = course
+
+    index_required_by(data_dict)
+    count('catalog.courses', len(data_dict))
+    return data_dict
+
+
+def iter_courses(path: str, fields: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+    """Yield the raw course records of the given courses file one at a time, reading the file
+    incrementally. If fields is not None, every other field is dropped from the records as soon
+    as they are decoded.
+
+    Raise ValueError if the file is not a JSON list of objects.
+    """
+    decoder = json.JSONDecoder()
+    with open(path) as json_data:
+        buffer = ''
+        position = 0
+        expected = '['
+        while True:
+            # skip the whitespace and separators between records
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                buffer, position = json_data.read(READ_SIZE), 0
+                if buffer == '':
+                    raise ValueError(f'{path} ended before the list of courses did')
+                continue
+
+            if expected == '[':
+                if buffer[position] != '[':
+                    raise ValueError(f'{path} does not contain a list of courses')
+                position += 1
+                expected = '{'
+            elif buffer[position] == ']':
+                return
+            else:
+                course, position, buffer = _decode_next(decoder, json_data, buffer, position)
+                if fields is not None:
+                    course = {key: course[key] for key in fields if key in course}
+                yield course
+
+
+def _decode_next(decoder: json.JSONDecoder, json_data: TextIO, buffer: str,
+                 position: int) -> Tuple[Dict, int, str]:
+    """Decode the course record starting at buffer[position], reading more of json_data into
+    the buffer until the record is complete. Return the record, the position after it and the
+    (possibly extended) buffer.
+    """
+    # drop what has already been decoded, so the buffer only ever holds a few records
+    buffer = buffer[position:]
+    read_size = READ_SIZE
+    while True:
+        try:
+            course, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = json_data.read(read_size)
+            if more == '':
+                raise
+            buffer += more
+            # grow the reads for records that are bigger than a read
+            read_size *= 2
         else:
-            add_tree(course, 'pre')
+            if not isinstance(course, dict):
+                raise ValueError('courses must be JSON objects')
+            return course, end, buffer
+
 
-        if 'corequisites' not in course or course['corequisites'] is None:
-            course['coreq_tree'] = None
+def compile_course(raw_course: Dict, previous: Optional[Dict] = None) -> Dict:
+    """Return a copy of the given raw course record, with its prerequisite and corequisite trees
+    added.
+
+    previous is an earlier compiled version of the same course, if any. Its trees are reused for
+    the requisites that have not changed instead of being parsed again.
+    """
+    # strings such as field names and departments repeat across courses, so they are interned to
+    # be shared
+    course = {sys.intern(key): _intern(value) for key, value in raw_course.items()}
+    for type in ('pre', 'co'):
+        requisites = course.get(type + 'requisites')
+        if requisites is None:
+            course[type + 'req_tree'] = None
+        elif previous is not None and \
+                requisites.replace(course['code'], '') == previous.get(type + 'requisites'):
+            course[type + 'requisites'] = previous[type + 'requisites']
+            course[type + 'req_tree'] = previous[type + 'req_tree']
         else:
-            add_tree(course, 'co')
+            add_tree(course, type)
+    return course
 
-        data_dict[course['code']] = course
+
+def compile_courses(data: List[Dict]) -> List[Dict]:
+    """Return compile_course of every raw course record in data."""
+    return [compile_course(course) for course in data]
+
+
+def _compile_parallel(data: Iterable[Dict], workers: int) -> Iterator[Dict]:
+    """Yield compile_course of every course in data, in order, computed in chunks by a pool of
+    workers processes. Only a few chunks are read ahead of the ones that have been yielded.
+    """
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = list(itertools.islice(data, PARALLEL_CHUNK_SIZE))
+            if chunk:
+                pending.append(executor.submit(compile_courses, chunk))
+            if pending and (not chunk or len(pending) >= 2 * workers):
+                # chunks are collected in the order they were submitted, so the catalog order is
+                # the same as when serial
+                for course in pending.popleft().result():
+                    yield _intern_course(course)
+            elif not chunk:
+                return
+
+
+def _intern_course(course: Dict) -> Dict:
+    """Mutate and return a course that has been sent from another process, interning its strings
+    again since they are no longer shared.
+    """
+    for key, value in list(course.items()):
+        del course[key]
+        course[sys.intern(key)] = _intern(value)
+    for tree in (course['prereq_tree'], course['coreq_tree']):
+        if tree is not None:
+            _intern_tree(tree)
+    return course
+
+
+def _intern(value: Any) -> Any:
+    """Return value interned if it is a string, otherwise return value unchanged."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _intern_tree(tree: PrereqTree) -> None:
+    """Mutate tree so that all of its items are interned."""
+    tree.item = sys.intern(tree.item)
+    for subtree in tree.subtrees:
+        _intern_tree(subtree)
+
+
+def index_required_by(data_dict: Dict[str, Dict]) -> None:
+    """Mutate every course in data_dict to add its 'required_by' list, i.e. the codes of the
+    courses that have it as a prerequisite, in the order they appear in data_dict.
+    """
+    for course in data_dict.values():
+        course['required_by'] = []
+
+    for code, course in data_dict.items():
+        if course['prereq_tree'] is None:
+            continue
+        for prereq in course['prereq_tree'].courses():
+            if prereq != code and prereq in data_dict:
+                data_dict[prereq]['required_by'].append(code)
+
+
+def update_courses_data(courses: dict, path: Union[str, Sequence[str]] = COURSES_FILE
+                        ) -> Dict[str, Tuple[Optional[Dict], Optional[Dict]]]:
+    """Mutate the catalog courses to match the given courses file(s), e.g. after the registrar
+    publishes a corrected courses.json, without rebuilding it. Return the changes made: a
+    dictionary mapping the code of every added, removed or changed course to its old and new
+    course dictionaries, where the old one is None for added courses and the new one is None for
+    removed courses.
+
+    Only the requisite strings that changed are parsed again, and the 'required_by' lists are
+    patched rather than rebuilt. Changed courses keep their place in the catalog, while added
+    courses go at the end. If courses is the in-memory catalog of path, its snapshot is updated
+    too, so get_courses_data keeps returning it.
+
+    Use catalog_update.update_catalog to also patch the indexes and graphs built from courses.
+    """
+    paths = _as_paths(path)
+    changes = {}
+    seen = set()
+    for source in paths:
+        for raw_course in iter_courses(source, COURSE_FIELDS):
+            code = raw_course['code']
+            seen.add(code)
+            old = courses.get(code)
+            if old is not None and _stored_fields(old) == _raw_fields(raw_course):
+                continue
+            new = compile_course(raw_course, old)
+            courses[code] = new
+            # a course repeated in a later file keeps the version it had before the update
+            changes[code] = (changes[code][0] if code in changes else old, new)
+
+    for code in [code for code in courses if code not in seen]:
+        changes[code] = (courses.pop(code), None)
+
+    _update_required_by(courses, changes)
+
+    cached = _CATALOGS.get(paths)
+    if cached is not None and cached[1] is courses:
+        fingerprint = _fingerprint(paths)
+        _save_snapshot(paths, fingerprint, courses)
+        _CATALOGS[paths] = (fingerprint, courses)
+    return changes
+
+
+def _raw_fields(raw_course: Dict) -> Dict:
+    """Return the fields of raw_course as compile_course stores them, without parsing anything."""
+    fields = dict(raw_course)
+    for key in ('prerequisites', 'corequisites'):
+        if fields.get(key) is not None:
+            fields[key] = fields[key].replace(raw_course['code'], '')
+    return fields
+
+
+def _stored_fields(course: Dict) -> Dict:
+    """Return the fields of the compiled course that come from its raw record."""
+    return {key: value for key, value in course.items() if key not in DERIVED_FIELDS}
+
+
+def _update_required_by(courses: Dict[str, Dict],
+                        changes: Dict[str, Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+    """Mutate the 'required_by' lists of courses to account for changes, in the format returned by
+    update_courses_data.
+    """
+    added = {code for code, (old, new) in changes.items() if old is None and new is not None}
+    for old, new in changes.values():
+        if new is not None:
+            new['required_by'] = [] if old is None else old['required_by']
+
+    if added:
+        # added courses may already be prerequisites of courses that have not changed
+        for code, course in courses.items():
+            if course['prereq_tree'] is not None:
+                for prereq in course['prereq_tree'].courses():
+                    if prereq in added and prereq != code:
+                        courses[prereq]['required_by'].append(code)
+
+    for code, (old, new) in changes.items():
+        old_prereqs = _prereqs(old)
+        new_prereqs = _prereqs(new)
+        for prereq in old_prereqs - new_prereqs:
+            if prereq in courses and prereq not in added and prereq != code:
+                courses[prereq]['required_by'].remove(code)
+        for prereq in new_prereqs - old_prereqs:
+            if prereq in courses and prereq not in added and prereq != code:
+                courses[prereq]['required_by'].append(code)
+
+
+def _prereqs(course: Optional[Dict]) -> Set[str]:
+    """Return the codes of the courses in the prerequisite tree of course, which may be None."""
+    if course is None or course['prereq_tree'] is None:
+        return set()
+    return course['prereq_tree'].courses()
+
+
+def clear_cache() -> None:
+    """Forget every in-memory catalog. Snapshots on disk are left untouched."""
+    _CATALOGS.clear()
+
+
+def snapshot_path(path: Union[str, Sequence[str]]) -> str:
+    """Return the path of the on-disk snapshot of the catalog compiled from path."""
+    paths = _as_paths(path)
+    if len(paths) == 1:
+        return paths[0] + '.pickle'
+    # catalogs combining several files are stored next to the first one, named after all of them
+    return f'{paths[0]}.{zlib.crc32("|".join(paths).encode()):08x}.pickle'
+
+
+def _as_paths(path: Union[str, Sequence[str]]) -> Tuple[str, ...]:
+    """Return path as a tuple of paths."""
+    return (path,) if isinstance(path, str) else tuple(path)
+
+
+def _fingerprint(paths: Tuple[str, ...]) -> tuple:
+    """Return a fingerprint of the source files that changes whenever a file is modified."""
+    stats = [os.stat(path) for path in paths]
+    return (SNAPSHOT_VERSION,) + tuple((stat.st_mtime_ns, stat.st_size) for stat in stats)
+
+
+def _load_snapshot(paths: Tuple[str, ...], fingerprint: tuple) -> Optional[dict]:
+    """Return the catalog stored in the snapshot of paths, or None if there is no usable snapshot
+    matching fingerprint.
+    """
+    try:
+        with open(snapshot_path(paths), 'rb') as snapshot:
+            stored_fingerprint, data_dict = pickle.load(snapshot)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+            TypeError, ValueError):
+        # missing, unreadable or corrupt snapshots are simply rebuilt
+        return None
+
+    if stored_fingerprint != fingerprint:
+        return None
     return data_dict
 
 
+def _save_snapshot(paths: Tuple[str, ...], fingerprint: tuple, data_dict: dict) -> None:
+    """Write data_dict to the snapshot of paths. Failing to write the snapshot is not an error,
+    the catalog will just be rebuilt next time.
+    """
+    target = snapshot_path(paths)
+    temp = f'{target}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'wb') as snapshot:
+            pickle.dump((fingerprint, data_dict), snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        # replace atomically so that concurrent readers never see a half-written snapshot
+        os.replace(temp, target)
+    except OSError:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
 def add_tree(course: Dict, type: str) -> None:
     """Mutates course to insert a prerequisite/corequisite tree (depending on type).
 
@@ -45,15 +409,29 @@ def add_tree(course: Dict, type: str) -> None:
     code = course['code']
     # if a course appears in its own req list then remove it.
     course[type + 'requisites'] = course[type + 'requisites'].replace(code, '')
-    tree = PrereqTree(course[type + 'requisites'])
+    course[type + 'req_tree'] = PrereqTree(course[type + 'requisites'])
+
+
+def tree_graph(course: Dict, type: str) -> Optional[nx.DiGraph]:
+    """Return the prerequisite/corequisite tree of course (depending on type) as a networkx graph,
+    with an edge from the course to the root of the tree. Return None if course has no such
+    requisites. The graph is built on demand and not stored in course.
+
+    Preconditions
+        - type in {'co', 'pre'}
+    """
+    tree = course[type + 'req_tree']
+    if tree is None:
+        return None
 
-    # add requisite tree to course dict
-    course[type + 'req_tree'], root, connective_count = convert_tree(tree, type + 'req', code)
+    code = course['code']
+    graph, root, _ = convert_tree(tree, type + 'req', code)
     # add course to graph
-    course[type + 'req_tree'].add_node(code, type='course', value=code)
+    graph.add_node(code, type='course', value=code)
     # add edge from course to req tree root
     if root != '':
-        course[type + 'req_tree'].add_edge(code, root, edge_type=type + 'req')
+        graph.add_edge(code, root, edge_type=type + 'req')
+    return graph
 
 
 def convert_tree(tree: PrereqTree, tree_type: str,
@@ -62,79 +440,60 @@ def convert_tree(tree: PrereqTree, tree_type: str,
     the total number of connectives counted so far.
     Connective_count counts the number of connectives encountered so far, so that we can label all
     connectives uniquely.
+
+    The graph is minimal: connectives are only added once their subtrees have been converted, in
+    a single post-order pass, so a connective that ends up with one child is replaced by that
+    child and one with no children is left out. Whole chains of single-child connectives collapse
+    this way. The root is '' if the tree contains no courses.
     Preconditions
         - tree_type in {'prereq', 'coreq'}
     """
     g = nx.DiGraph()
-    if tree.subtrees == []:
-        # base case: leaf node, which always represents a course
-        if tree.item == '':
-            return g, '', connective_count
-        g.add_node(tree.item, type='course', value=tree.item)
-        return g, tree.item, connective_count
-    else:
-        # create a copy to avoid mutation
-        connective_count_2 = connective_count
-
-        # add root of tree to g
-        tree_root_label = f'{tree.item}_{course}_{connective_count_2}'
-        g.add_node(tree_root_label, type='connective', value=tree.item)
-        connective_count_2 += 1
-
-        # convert & add subtrees to g
-        for subtree in tree.subtrees:
-            # helper
-            connective_count_2 = add_subtree(g, subtree, tree_type, course,
-                                             connective_count_2, tree_root_label)
-
-        return g, tree_root_label, connective_count_2
+    root, connective_count = add_subtree(g, tree, tree_type, course, connective_count)
+    return g, root, connective_count
 
 
 def add_subtree(g: nx.DiGraph, subtree: PrereqTree, tree_type: str, course: str,
-                connective_count: int, tree_root_label: str) -> int:
-    """Converts the given subtree to nx.DiGraph object and composes it into g (g is mutated).
-    Returns the updated value of connective_count i.e. the number of connectives encountered
-    so far.
+                connective_count: int) -> Tuple[str, int]:
+    """Adds the given subtree to g (g is mutated), collapsing redundant connectives as described
+    in convert_tree. Returns the label of the subtree's root in g ('' if it has no courses) and
+    the updated value of connective_count i.e. the number of connectives labelled so far.
     Preconditions
         - tree_type in {'prereq', 'coreq'}
     """
-    # counts the number of connectives encountered so far in order to label any upcoming connectives
-    connective_count_2 = connective_count
-
-    # convert this subtree to nx.DiGraph object. This is the recursive step in convert_graph.
-    converted_subtree, subtree_root, connective_count_2 = \
-        convert_tree(subtree, tree_type, course, connective_count_2)
-
-    if subtree_root == '':
-        return connective_count
+    if subtree.subtrees == []:
+        # base case: leaf node, which always represents a course
+        if subtree.item == '':
+            return '', connective_count
+        g.add_node(subtree.item, type='course', value=subtree.item)
+        return subtree.item, connective_count
 
-    # add nodes from converted_subtree to g
-    for node in converted_subtree.nodes(data=True):
-        if node[0] in {'or', 'and'}:
-            # if node is an unlabeled connective
-            g.add_node(f'{node[0]}_{course}_{connective_count_2}', type='connective', value=node[0])
-            connective_count_2 += 1
-        else:
-            # if node is a labeled connective or a course (all courses have already been labeled
-            # in the base case of convert_tree)
-            g.add_node(node[0], type=node[1]['type'], value=node[1]['value'])
-            if node[1]['type'] == 'connective':
-                connective_count_2 += 1
+    # convert the children first, keeping each distinct non-empty root once
+    roots = {}
+    for child in subtree.subtrees:
+        root, connective_count = add_subtree(g, child, tree_type, course, connective_count)
+        if root != '':
+            roots[root] = None
 
-    # add edge from tree root to this subtree's root
-    g.add_edge(tree_root_label, subtree_root, edge_type=tree_type)
-    # add edges from converted_subtree to g
-    g.add_edges_from(converted_subtree.edges, edge_type=tree_type)
+    if len(roots) <= 1:
+        # a connective with at most one child is redundant
+        return next(iter(roots), ''), connective_count
 
-    return connective_count_2
+    # prerequisite and corequisite connectives are labelled apart, since both end up in the
+    # global requisite graph
+    label = f'{subtree.item}_{course}_{tree_type}_{connective_count}'
+    g.add_node(label, type='connective', value=subtree.item)
+    g.add_edges_from(((label, root) for root in roots), edge_type=tree_type)
+    return label, connective_count + 1
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['re', 'json', 'networkx'],
-        'allowed-io': ['get_courses_data'],
+        'extra-imports': ['re', 'json', 'os', 'pickle', 'sys', 'zlib', 'itertools', 'collections',
+                          'concurrent.futures', 'networkx', 'instrumentation'],
+        'allowed-io': ['iter_courses', '_load_snapshot', '_save_snapshot'],
         'max-line-length': 100,
         'disable': ['E1136']
     })
@@ -0,0 +1,215 @@
+"""CSC111 Project: University of Toronto Course Finder: Eligibility
+
+Module Description:
+====================
+The module contains the code that works out which courses a student can take, given the courses
+they have completed (their transcript).
+
+The prerequisite trees of the whole catalog are compiled once into a single program over course
+columns: every distinct and/or node becomes one column, shared by all the trees it appears in, and
+nodes are grouped by height. A batch of transcripts is a boolean matrix with one row per student,
+and each group of nodes is evaluated for every student at once with NumPy, so the whole catalog is
+checked in one pass per tree level rather than one tree at a time.
+
+Only prerequisites are checked, since corequisites can be taken at the same time as the course.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterable, List, Tuple, Union
+import numpy as np
+from PrereqTree_class import PrereqTree
+from data_filtering import CourseView, get_indexes
+
+# the number of transcripts evaluated at a time, which bounds the memory used by a batch
+BATCH_SIZE = 1024
+
+# the compiled program of the catalog it was compiled from
+_STATE = {'courses': None, 'program': None}
+
+
+def get_program(courses: Dict[str, Dict]) -> Dict:
+    """Return the compiled prerequisite program of the catalog courses, compiling it if it does not
+    exist yet. The program is a dictionary with the following keys:
+        - 'ids': a dictionary mapping every course code that appears in the catalog (as a course or
+            as a prerequisite) to its column
+        - 'true': the column that is always True, for courses without prerequisites
+        - 'size': the total number of columns
+        - 'groups': a list of (kind, first, children, offsets) tuples, in evaluation order; the
+            columns first, first + 1, ... are the 'and' or 'or' (kind) of the columns in
+            children[offsets[0]:offsets[1]], children[offsets[1]:offsets[2]], ...
+        - 'codes': the codes of the courses of the catalog, in catalog order
+        - 'roots': the column holding whether the prerequisites of each course in 'codes' are
+            satisfied
+    """
+    if _STATE['courses'] is not courses:
+        _STATE['program'] = compile_program(courses)
+        _STATE['courses'] = courses
+    return _STATE['program']
+
+
+def clear_cache() -> None:
+    """Forget the compiled program, e.g. after the catalog has been updated."""
+    _STATE['courses'] = None
+    _STATE['program'] = None
+
+
+def compile_program(courses: Dict[str, Dict]) -> Dict:
+    """Return the compiled prerequisite program of courses, bypassing the cache. See get_program
+    for its format.
+    """
+    ids = {code: column for column, code in enumerate(courses)}
+    for course in courses.values():
+        if course['prereq_tree'] is not None:
+            for code in course['prereq_tree'].courses():
+                ids.setdefault(code, len(ids))
+    true = len(ids)
+
+    # and/or nodes before they are given columns, as (kind, children) keys mapped to temporary
+    # ids; equal nodes are only compiled once
+    nodes = {}
+    heights = {}
+    temporary_roots = [_compile_tree(course['prereq_tree'], ids, true, nodes, heights)
+                       if course['prereq_tree'] is not None else true
+                       for course in courses.values()]
+
+    # give the and/or nodes columns after the course columns, grouped by height and kind so that
+    # every group can be evaluated at once
+    order = sorted(nodes.items(), key=lambda node: (heights[node[1]], node[0][0]))
+    columns = {}
+    for position, (_, temporary) in enumerate(order):
+        columns[temporary] = true + 1 + position
+
+    groups = []
+    for (kind, children), temporary in order:
+        height = heights[temporary]
+        if not groups or groups[-1][0] != (height, kind):
+            groups.append(((height, kind), columns[temporary], [], [0]))
+        group_children, offsets = groups[-1][2], groups[-1][3]
+        group_children.extend(columns.get(child, child) for child in children)
+        offsets.append(len(group_children))
+
+    return {'ids': ids, 'true': true, 'size': true + 1 + len(order),
+            'groups': [(kind, first, np.array(children), np.array(offsets[:-1]))
+                       for (_, kind), first, children, offsets in groups],
+            'codes': list(courses),
+            'roots': np.array([columns.get(root, root) for root in temporary_roots], dtype=int)}
+
+
+def _compile_tree(tree: PrereqTree, ids: Dict[str, int], true: int,
+                  nodes: Dict[Tuple[str, Tuple[int, ...]], int], heights: Dict[int, int]) -> int:
+    """Return the column, or the temporary id of the and/or node, that holds whether tree is
+    satisfied, adding the and/or nodes of tree to nodes and their heights to heights.
+
+    Temporary ids are negative so that they cannot be confused with course columns. Empty
+    subtrees are always satisfied, like convert_tree leaves them out of the requisite graphs.
+    """
+    if tree.subtrees == []:
+        return ids[tree.item] if tree.item != '' else true
+
+    children = {_compile_tree(subtree, ids, true, nodes, heights) for subtree in tree.subtrees
+                if subtree.subtrees != [] or subtree.item != ''}
+    if tree.item == 'or' and true in children:
+        return true
+    children.discard(true)
+    if len(children) == 0:
+        return true
+    if len(children) == 1:
+        return children.pop()
+
+    key = (tree.item, tuple(sorted(children)))
+    if key not in nodes:
+        nodes[key] = -1 - len(nodes)
+        heights[nodes[key]] = 1 + max(heights.get(child, 0) for child in children)
+    return nodes[key]
+
+
+def transcript_matrix(transcripts: List[Iterable[str]], ids: Dict[str, int],
+                      size: int) -> np.ndarray:
+    """Return a boolean matrix with a row for each transcript and size columns, where the column
+    of each course code in ids is True if the course is in the transcript. Courses that do not
+    appear in ids are ignored, since no prerequisite depends on them.
+    """
+    rows, columns = [], []
+    for row, transcript in enumerate(transcripts):
+        for code in transcript:
+            if code in ids:
+                rows.append(row)
+                columns.append(ids[code])
+    matrix = np.zeros((len(transcripts), size), dtype=bool)
+    matrix[rows, columns] = True
+    return matrix
+
+
+def eligibility_matrix(courses: Dict[str, Dict], transcripts: List[Iterable[str]],
+                       include_completed: bool = False) -> np.ndarray:
+    """Return a boolean matrix with a row for each transcript and a column for each course of the
+    catalog courses, in catalog order, which is True where the student has completed all of the
+    prerequisites of the course. Completed courses are False unless include_completed.
+    """
+    program = get_program(courses)
+    result = np.zeros((len(transcripts), len(program['codes'])), dtype=bool)
+    for start in range(0, len(transcripts), BATCH_SIZE):
+        batch = transcripts[start:start + BATCH_SIZE]
+        values = transcript_matrix(batch, program['ids'], program['size'])
+        completed = values[:, :len(program['codes'])].copy()
+        values[:, program['true']] = True
+        for kind, first, children, offsets in program['groups']:
+            reduce = np.logical_and if kind == 'and' else np.logical_or
+            values[:, first:first + len(offsets)] = reduce.reduceat(values[:, children], offsets,
+                                                                    axis=1)
+        eligible = values[:, program['roots']]
+        if not include_completed:
+            eligible &= ~completed
+        result[start:start + len(batch)] = eligible
+    return result
+
+
+def eligible_courses(courses: Dict[str, Dict], completed: Iterable[str],
+                     include_completed: bool = False) -> CourseView:
+    """Return a view of the courses of the catalog courses whose prerequisites are all in
+    completed. The view can be filtered further with data_filtering.select. Completed courses are
+    left out unless include_completed.
+    """
+    row = eligibility_matrix(courses, [list(completed)], include_completed)[0]
+    indexes = get_indexes(courses)
+    codes = get_program(courses)['codes']
+    bits = 0
+    for column in np.flatnonzero(row):
+        bits |= 1 << indexes['positions'][codes[column]]
+    return CourseView(courses, bits, indexes)
+
+
+def eligible_batch(courses: Dict[str, Dict], transcripts: List[Iterable[str]],
+                   include_completed: bool = False) -> List[List[str]]:
+    """Return, for each transcript, the codes of the courses of the catalog courses that the
+    student can take, in catalog order. See eligibility_matrix.
+    """
+    codes = get_program(courses)['codes']
+    return [[codes[column] for column in np.flatnonzero(row)]
+            for row in eligibility_matrix(courses, transcripts, include_completed)]
+
+
+def is_satisfied(tree: Union[PrereqTree, None], completed: set) -> bool:
+    """Return whether the requisites in tree are satisfied by the courses in completed, evaluating
+    the tree directly. A tree of None has no requisites and is always satisfied.
+    """
+    if tree is None or (tree.subtrees == [] and tree.item == ''):
+        return True
+    if tree.subtrees == []:
+        return tree.item in completed
+    results = [is_satisfied(subtree, completed) for subtree in tree.subtrees
+               if subtree.subtrees != [] or subtree.item != '']
+    if tree.item == 'or':
+        return results == [] or any(results)
+    return all(results)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['numpy', 'PrereqTree_class', 'data_filtering'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -5,32 +5,67 @@ Module Description:
 The module contains the functions that generate the 'future graphs' for a given course.
 """
 
-from typing import Dict
+import functools
+from typing import Dict, List, Optional
 import networkx as nx
+from instrumentation import count, timed
+from traversal import find_cycles, traverse
 
 
-def future(courses: Dict[str, Dict], course: str) -> nx.Graph():
-    """Return a graph containing all the future courses that this course can lead to. """
+@timed('future.build')
+def future(courses: Dict[str, Dict], course: str, max_depth: Optional[int] = None,
+           max_nodes: Optional[int] = None, seconds: Optional[float] = None) -> nx.Graph():
+    """Return a graph containing all the future courses that this course can lead to. Only courses
+    in courses are included, but course itself does not need to be in courses.
+
+    The traversal can be limited to courses at most max_depth prerequisite steps away from course,
+    to max_nodes courses and to the given number of seconds, see traversal.traverse. The
+    'truncated' graph attribute of the result says whether a limit was reached, and its 'cycles'
+    attribute lists the prerequisite cycles in it.
+    """
     future_graph = nx.Graph()
     future_graph.add_node(course, tag='original', type='course', value=course)
-    add_children(courses, course, future_graph)
+    add_children(courses, course, future_graph, max_depth, max_nodes, seconds)
+    count('future.nodes', len(future_graph))
+    count('future.edges', future_graph.number_of_edges())
     return future_graph
 
 
-def add_children(courses: Dict[str, Dict], course: str, graph: nx.Graph()) -> None:
-    """Mutate the given graph object to add all the courses that course is a prerequisite for. """
-    for item in courses:
-        if courses[item]['prerequisites'] is not None and course in courses[item]['prerequisites']:
+def add_children(courses: Dict[str, Dict], course: str, graph: nx.Graph(),
+                 max_depth: Optional[int] = None, max_nodes: Optional[int] = None,
+                 seconds: Optional[float] = None) -> None:
+    """Mutate the given graph object to add all the courses that course is a prerequisite for,
+    directly or indirectly, within the given limits (see future). Each course is expanded at most
+    once, using the 'required_by' index.
+    """
+    result = traverse(course, functools.partial(required_by, courses), max_depth, max_nodes,
+                      seconds)
+    for item in result['depths']:
+        if item not in graph:
             graph.add_node(item, tag='no', type='course', value=item)
-            graph.add_edge(course, item, edge_type='future')
-            add_children(courses, item, graph)
+    graph.add_edges_from(result['edges'], edge_type='future')
+    cycles = find_cycles(nx.DiGraph(result['edges'])) if result['backward'] else []
+    graph.graph.update(truncated=result['truncated'], cycles=cycles)
+
+
+def required_by(courses: Dict[str, Dict], course: str) -> List[str]:
+    """Return the codes of the courses in courses that have course as a prerequisite."""
+    if course in courses:
+        return [item for item in courses[course]['required_by'] if item in courses]
+    catalog = getattr(courses, 'catalog', {})
+    if course in catalog:
+        # course has been filtered out of the view, but its index entry is still in the catalog
+        return [item for item in catalog[course]['required_by'] if item in courses]
+    # course is not in the catalog at all, so we look it up directly
+    return [item for item in courses if courses[item]['prereq_tree'] is not None
+            and item != course and course in courses[item]['prereq_tree'].courses()]
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['networkx'],
+        'extra-imports': ['functools', 'networkx', 'instrumentation', 'traversal'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['E1136']
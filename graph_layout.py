@@ -0,0 +1,272 @@
+"""CSC111 Project: University of Toronto Course Finder: Graph Layout
+
+Module Description:
+===================
+The module contains the layout algorithms used to position the vertices of the graphs before they
+are drawn.
+
+Planar graphs use networkx's planar layout. Other graphs use a stress layout (the same objective as
+Kamada-Kawai) computed with NumPy from an all-pairs hop distance matrix, or a layered layout in
+near-linear time once they are too big for an all-pairs layout.
+
+Layouts are cached by a fingerprint of the graph, in memory and optionally on disk, so that
+showing the same graph again skips the layout entirely.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+import hashlib
+import os
+import pickle
+import networkx as nx
+import numpy as np
+from scipy.sparse.csgraph import shortest_path
+from instrumentation import count, span, timed
+
+# the largest number of vertices of a non-planar graph given a stress layout; bigger graphs get
+# a layered layout, since the stress layout takes quadratic time and memory
+STRESS_MAX_NODES = 300
+# the number of iterations used to compute a stress layout
+STRESS_ITERATIONS = 100
+# the version of the layout algorithms, changed whenever they place vertices differently so that
+# layouts cached on disk by an earlier version are not reused
+LAYOUT_VERSION = 2
+# the number of layouts kept in memory
+LAYOUT_CACHE_SIZE = 128
+
+# layouts kept in memory, in least to most recently used order, the directory of the on-disk
+# cache (None if there is none) and the number of layouts found in and missing from the cache
+_CACHE = {'layouts': OrderedDict(), 'directory': None,
+          'stats': {'hits': 0, 'disk_hits': 0, 'misses': 0}}
+
+
+def layout(graph: nx.Graph) -> Dict[Hashable, np.ndarray]:
+    """Return a dictionary mapping each vertex of graph to its position, choosing the layout
+    algorithm based on the shape and size of graph. Layouts are cached, see layout_cache_stats.
+    """
+    key = fingerprint(graph)
+    layouts = _CACHE['layouts']
+    if key in layouts:
+        _CACHE['stats']['hits'] += 1
+        count('layout.hits')
+        layouts.move_to_end(key)
+        return dict(layouts[key])
+
+    pos = _load_layout(key)
+    if pos is not None:
+        _CACHE['stats']['disk_hits'] += 1
+        count('layout.disk_hits')
+    else:
+        _CACHE['stats']['misses'] += 1
+        count('layout.misses')
+        pos = compute_layout(graph)
+        _save_layout(key, pos)
+
+    layouts[key] = pos
+    if len(layouts) > LAYOUT_CACHE_SIZE:
+        layouts.popitem(last=False)
+    return dict(pos)
+
+
+@timed('layout.compute')
+def compute_layout(graph: nx.Graph) -> Dict[Hashable, np.ndarray]:
+    """Return a dictionary mapping each vertex of graph to its position, bypassing the cache."""
+    with span('layout.planarity'):
+        planar = nx.check_planarity(graph)[0]
+    if planar:
+        # if graph is planar, use planar layout
+        return nx.planar_layout(graph)
+    elif len(graph) <= STRESS_MAX_NODES:
+        return stress_layout(graph)
+    else:
+        return layered_layout(graph)
+
+
+def fingerprint(graph: nx.Graph) -> str:
+    """Return a fingerprint of everything the layout of graph depends on: its vertices and edges,
+    whether it is directed, which vertices are the searched course (the filters used to build a
+    graph only matter through its vertices) and the layout settings.
+    """
+    canonical = repr((LAYOUT_VERSION, graph.is_directed(), STRESS_MAX_NODES, STRESS_ITERATIONS,
+                      sorted(map(repr, graph.nodes)),
+                      sorted(repr(edge) for edge in graph.edges),
+                      sorted(repr(node) for node, tag in graph.nodes(data='tag')
+                             if tag == 'original')))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def set_layout_cache_directory(directory: Optional[str]) -> None:
+    """Store layouts in directory as well as in memory, or only in memory if directory is None.
+    The directory is created if it does not exist.
+    """
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _CACHE['directory'] = directory
+
+
+def layout_cache_stats() -> Dict[str, int]:
+    """Return the number of layouts found in memory ('hits'), found on disk ('disk_hits') and
+    computed from scratch ('misses') so far, and the number of layouts in memory ('size').
+    """
+    return {**_CACHE['stats'], 'size': len(_CACHE['layouts'])}
+
+
+def clear_layout_cache() -> None:
+    """Forget every layout kept in memory and reset the statistics. The on-disk cache is kept."""
+    _CACHE['layouts'].clear()
+    for stat in _CACHE['stats']:
+        _CACHE['stats'][stat] = 0
+
+
+def _load_layout(key: str) -> Optional[Dict[Hashable, np.ndarray]]:
+    """Return the layout with the given fingerprint from the on-disk cache, or None if it is not
+    there.
+    """
+    if _CACHE['directory'] is None:
+        return None
+    try:
+        with open(os.path.join(_CACHE['directory'], key + '.pickle'), 'rb') as cached:
+            return pickle.load(cached)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+            TypeError, ValueError):
+        return None
+
+
+def _save_layout(key: str, pos: Dict[Hashable, np.ndarray]) -> None:
+    """Store the layout with the given fingerprint in the on-disk cache, if there is one."""
+    if _CACHE['directory'] is None:
+        return
+    target = os.path.join(_CACHE['directory'], key + '.pickle')
+    temp = f'{target}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'wb') as cached:
+            pickle.dump(pos, cached, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, target)
+    except OSError:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def hop_distances(graph: nx.Graph, nodes: List[Hashable]) -> np.ndarray:
+    """Return the matrix of the lengths of the shortest paths between the vertices of graph,
+    ignoring the direction of its edges, where the rows and columns are in the order of nodes.
+    Vertices that cannot reach each other are given the longest distance in the graph, so that
+    the layout spaces them out.
+
+    Directions are ignored since a layout can only be symmetric: in a directed acyclic graph, one
+    of the two directed distances between every pair of vertices is unreachable.
+    """
+    adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight=None, format='csr')
+    distances = shortest_path(adjacency, directed=False, unweighted=True)
+    unreachable = np.isinf(distances)
+    if unreachable.any():
+        distances[unreachable] = distances[~unreachable].max()
+    return distances
+
+
+@timed('layout.stress')
+def stress_layout(graph: nx.Graph) -> Dict[Hashable, np.ndarray]:
+    """Return a layout of graph that places vertices so that their euclidean distances match their
+    hop distances, minimizing the same energy as nx.kamada_kawai_layout.
+    """
+    nodes = list(graph.nodes)
+    if len(nodes) <= 1:
+        return {node: np.zeros(2) for node in nodes}
+
+    distances = hop_distances(graph, nodes)
+    with np.errstate(divide='ignore'):
+        weights = np.where(distances > 0, distances ** -2.0, 0)
+    weight_sums = weights.sum(axis=1)
+    weight_sums[weight_sums == 0] = 1
+
+    # start from a circle, like nx.kamada_kawai_layout
+    angles = np.linspace(0, 2 * np.pi, len(nodes), endpoint=False)
+    positions = np.column_stack([np.cos(angles), np.sin(angles)]) * distances.max() / 2
+
+    for _ in range(STRESS_ITERATIONS):
+        # move every vertex to where its weighted neighbours at their ideal distances place it
+        differences = positions[:, np.newaxis, :] - positions[np.newaxis, :, :]
+        lengths = np.sqrt((differences ** 2).sum(axis=2))
+        np.fill_diagonal(lengths, 1)
+        lengths[lengths == 0] = 1e-9
+        pulls = weights * distances / lengths
+        positions = (weights @ positions + (pulls[:, :, np.newaxis] * differences).sum(axis=1)) \
+            / weight_sums[:, np.newaxis]
+
+    return dict(zip(nodes, nx.rescale_layout(positions)))
+
+
+@timed('layout.layered')
+def layered_layout(graph: nx.Graph) -> Dict[Hashable, np.ndarray]:
+    """Return a layered (Sugiyama-style) layout of graph in near-linear time.
+
+    Vertices are put into layers by requisite depth: the longest path from a source in a directed
+    acyclic graph, otherwise the number of steps from the searched course. Vertices in each layer
+    are ordered by the average position of their neighbours in the layer above, which keeps edge
+    crossings down.
+    """
+    layers = _layers(graph)
+    rows = {}
+    for node, layer in layers.items():
+        rows.setdefault(layer, []).append(node)
+
+    order = {}
+    for layer in sorted(rows):
+        row = rows[layer]
+        barycenters = {}
+        for node in row:
+            above = [order[neighbour] for neighbour in _neighbours(graph, node)
+                     if neighbour in order and layers[neighbour] < layer]
+            barycenters[node] = sum(above) / len(above) if above else len(order)
+        row.sort(key=lambda vertex: barycenters[vertex])
+        for index, node in enumerate(row):
+            order[node] = (index + 1) / (len(row) + 1)
+
+    positions = np.array([[order[node], -layers[node]] for node in graph.nodes], dtype=float)
+    if len(positions) == 0:
+        return {}
+    return dict(zip(graph.nodes, nx.rescale_layout(positions)))
+
+
+def _layers(graph: nx.Graph) -> Dict[Hashable, int]:
+    """Return the layer of every vertex of graph, as described in layered_layout."""
+    if graph.is_directed() and nx.is_directed_acyclic_graph(graph):
+        layers = {}
+        for node in nx.topological_sort(graph):
+            layers[node] = max((layers[parent] + 1 for parent in graph.predecessors(node)),
+                               default=0)
+        return layers
+
+    sources = [node for node, tag in graph.nodes(data='tag') if tag == 'original']
+    layers = {}
+    for node in sources + list(graph.nodes):
+        if node in layers:
+            continue
+        # breadth-first from each vertex that has not been reached yet
+        layers[node] = 0
+        queue = [node]
+        for current in queue:
+            for neighbour in _neighbours(graph, current):
+                if neighbour not in layers:
+                    layers[neighbour] = layers[current] + 1
+                    queue.append(neighbour)
+    return layers
+
+
+def _neighbours(graph: nx.Graph, node: Hashable) -> List[Hashable]:
+    """Return the vertices adjacent to node in graph, in either direction."""
+    if graph.is_directed():
+        return list(graph.predecessors(node)) + list(graph.successors(node))
+    return list(graph.neighbors(node))
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['collections', 'hashlib', 'os', 'pickle', 'networkx', 'numpy',
+                          'scipy.sparse.csgraph', 'instrumentation'],
+        'allowed-io': ['_load_layout', '_save_layout'],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -3,20 +3,144 @@
 Module Description:
 ====================
 The module contains the code for the graphical user interface.
+
+Graphs are built and laid out on a background thread, so that the window stays responsive while
+they are computed. Finished figures are handed back to the Tk main thread, which shows them.
+
+The window appears before anything heavy is imported: the catalog is loaded on the background
+thread, which also imports the graph and visualization modules (networkx, plotly, ...) in the
+meantime, and the department filter is filled in once the catalog is ready.
+
+The course code box suggests courses as they are typed, by code or by the words of their names,
+and a search for a code that does not exist offers the closest courses instead (see
+course_search).
 """
 
+import importlib
+import queue
 import tkinter as tk
-from visualizing_graph import future_run, prereq_run
-from data_formatting import get_courses_data
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 from tkinter import ttk
+from course_search import complete, describe, get_search_index, resolve, search
 from data_filtering import filter_courses
 
+# how often the main thread checks for finished graphs, in milliseconds
+POLL_MS = 50
+# the number of courses suggested while typing, and when no course matches the search exactly
+COMPLETIONS = 10
+SUGGESTIONS = 5
 
-def run_app() -> None:
-    """Run the application. """
+
+class GraphTasks:
+    """Computes graphs on a background thread, one at a time, and hands the results back to the
+    Tk main thread.
+
+    Starting a task supersedes the previous one: it is cancelled if it has not started yet, and its
+    result is dropped otherwise, since a running thread cannot be interrupted.
+
+    Instance Attributes:
+        - root: the Tk root whose event loop receives the results
+        - executor: the single background thread the tasks run on
+        - results: the results of finished tasks, with the generation of the task that made them
+        - generation: the number of the latest task started
+        - current: the future of the latest task, or None if no task was started yet
+    """
+    root: tk.Tk
+    executor: ThreadPoolExecutor
+    results: queue.Queue
+    generation: int
+    current: Optional[Future]
+
+    def __init__(self, root: tk.Tk) -> None:
+        self.root = root
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.generation = 0
+        self.current = None
+        self.root.after(POLL_MS, self._poll)
+
+    def start(self, compute: Callable[[], object],
+              on_done: Callable[[object, Optional[BaseException]], None]) -> None:
+        """Run compute in the background, superseding the previous task. on_done is later called
+        on the main thread with the result of compute and None, or None and the error it raised.
+        """
+        self.cancel()
+        generation = self.generation
+
+        def run() -> None:
+            try:
+                self.results.put((generation, on_done, compute(), None))
+            except Exception as error:  # reported to the user by on_done
+                self.results.put((generation, on_done, None, error))
+
+        self.current = self.executor.submit(run)
+
+    def cancel(self) -> None:
+        """Cancel the latest task, if it has not finished yet."""
+        if self.current is not None:
+            self.current.cancel()
+        self.generation += 1
+
+    def shutdown(self) -> None:
+        """Stop accepting tasks and drop the ones that have not started yet."""
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self) -> None:
+        """Pass the results of the tasks that finished since the last poll to their on_done
+        callbacks, skipping superseded tasks. The next poll is scheduled even if a callback
+        raises, so that later results still reach the window.
+        """
+        try:
+            while True:
+                try:
+                    generation, on_done, result, error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if generation == self.generation:
+                    on_done(result, error)
+        finally:
+            self.root.after(POLL_MS, self._poll)
+
+
+def load_catalog() -> Tuple[Dict[str, Dict], List[str]]:
+    """Return the catalog and its sorted list of departments. Ran in the background when the
+    application starts, so the modules needed to load the catalog and draw graphs are imported
+    here rather than when the window is created.
+    """
+    from data_formatting import get_courses_data
     courses = get_courses_data()
     departments = list({courses[course]['department'] for course in courses})
     departments.sort()
+    get_search_index(courses)
+    # the first graph shown should not have to wait for plotly to be imported
+    importlib.import_module('visualizing_graph')
+    return courses, departments
+
+
+def prereq_figure(course: str) -> object:
+    """Return the figure of the prerequisite graph of course, see visualizing_graph."""
+    from visualizing_graph import prereq_figure as figure
+    return figure(course)
+
+
+def future_figure(future_courses: Dict, course: str) -> object:
+    """Return the figure of the future graph of course, see visualizing_graph."""
+    from visualizing_graph import future_figure as figure
+    return figure(future_courses, course)
+
+
+def run_app() -> None:
+    """Run the application. """
+    build_app().mainloop()
+
+
+def build_app() -> tk.Tk:
+    """Create the main window of the application and start loading the catalog in the
+    background. Return the window, without running its event loop.
+    """
+    catalog = {'courses': None}
     levels = ['100-level', '200-level', '300-level', '400-level']
     breadths = ['(1) Creative and Cultural Representation',
                 '(2) Thought, Belief and Behaviour',
@@ -24,40 +148,111 @@ def run_app() -> None:
                 '(4) Living Things and Their Environment',
                 '(5) The Physical and Mathematical Universes']
 
+    def show_graph(name: str, compute: Callable[[], object]) -> None:
+        """Build a graph in the background with compute and show it once it is ready."""
+        status.set(f'Building the {name}...')
+        progress.start()
+
+        def done(fig: object, error: Optional[BaseException]) -> None:
+            progress.stop()
+            if error is not None:
+                status.set(f'Could not build the {name}: {error}')
+                return
+            status.set('')
+            try:
+                fig.show()
+            except Exception as show_error:  # such as no browser to show it in
+                status.set(f'Could not show the {name}: {show_error}')
+
+        tasks.start(compute, done)
+
     def retrieve() -> None:
         """Ran whenever 'Search' button is clicked on the main screen. """
+        # a new search supersedes the graph of the previous one
+        tasks.cancel()
+        progress.stop()
+        status.set('')
+
         br = breadth_list.get()
         lvl = level_list.get()
         if lvl != '':
             lvl = lvl[0]
         department = dept_filter.get()
+        courses = catalog['courses']
         future_courses_dict = filter_courses(courses, lvl, department, br)
+        text = course_input.get()
+        code = resolve(courses, text)
+        suggestions = [] if code is not None else search(courses, text, SUGGESTIONS)
 
-        newroot = tk.Tk()
-        newroot.geometry("300x100")
+        if windows['results'] is not None and windows['results'].winfo_exists():
+            windows['results'].destroy()
+        newroot = tk.Toplevel(root)
+        newroot.geometry(f"300x{100 + 30 * len(suggestions)}")
+        windows['results'] = newroot
 
         newframe = tk.Frame(newroot)
         newframe.pack()
 
-        if course_input.get() in courses:
+        if code is not None:
             prereq_button = tk.Button(newframe, text="Prerequisite Graph",
-                                      command=lambda: prereq_run(course_input.get())
-                                      )
+                                      command=lambda: show_graph(
+                                          f'prerequisite graph of {code}',
+                                          lambda: prereq_figure(code)))
             prereq_button.pack(side=tk.LEFT, padx=5, pady=20)
 
             future_button = tk.Button(newframe, text="Future Graph",
-                                      command=lambda: future_run(future_courses_dict,
-                                                                 course_input.get()))
+                                      command=lambda: show_graph(
+                                          f'future graph of {code}',
+                                          lambda: future_figure(future_courses_dict, code)))
             future_button.pack(padx=5, pady=20)
         else:
-            show_error = tk.Label(newframe, text='Sorry, no such course exists in the database. '
-                                                 'Please type the course code exactly as it would '
-                                                 'appear on the academic calendar.', wraplength=250,
+            if suggestions != []:
+                message = 'Sorry, no such course exists in the database. Did you mean:'
+            else:
+                message = 'Sorry, no such course exists in the database. ' \
+                          'Please type the course code exactly as it would ' \
+                          'appear on the academic calendar.'
+            show_error = tk.Label(newframe, text=message, wraplength=250,
                                   justify=tk.CENTER, pady=20)
             show_error.pack()
+            for suggestion in suggestions:
+                suggestion_button = tk.Button(newframe, text=describe(courses, suggestion),
+                                              command=lambda s=suggestion: pick(s))
+                suggestion_button.pack(fill=tk.X)
+
+    def pick(code: str) -> None:
+        """Ran when a suggested course is clicked: search for it instead."""
+        course_input.set(code)
+        retrieve()
+
+    def suggest(_: tk.Event) -> None:
+        """Ran whenever a key is released in the course code box, to offer completions."""
+        if catalog['courses'] is not None:
+            codes = complete(catalog['courses'], course_input.get(), COMPLETIONS)
+            course_input['values'] = [describe(catalog['courses'], code) for code in codes]
+
+    def loaded(result: Optional[Tuple[Dict[str, Dict], List[str]]],
+               error: Optional[BaseException]) -> None:
+        """Ran once the catalog has been loaded in the background."""
+        progress.stop()
+        if error is not None:
+            status.set(f'Could not load the course catalog: {error}')
+            return
+        catalog['courses'], departments = result
+        dept_filter['values'] = departments
+        search_button['state'] = tk.NORMAL
+        status.set('')
+
+    def close() -> None:
+        """Ran when the main window is closed."""
+        tasks.shutdown()
+        root.destroy()
 
     root = tk.Tk()
-    root.geometry("300x200")
+    root.geometry("300x260")
+    root.protocol('WM_DELETE_WINDOW', close)
+    tasks = GraphTasks(root)
+    windows = {'results': None}
 
     frame = tk.Frame(root)
     frame.pack()
@@ -68,7 +263,8 @@ def run_app() -> None:
     label = tk.Label(frame, textvariable=var, pady=5)
     label.pack()
 
-    course_input = tk.Entry(frame, width=20)
+    course_input = ttk.Combobox(frame, values=[], width=40)
+    course_input.bind('<KeyRelease>', suggest)
     course_input.pack(padx=5, pady=5)
 
     advanced = tk.StringVar()
@@ -85,22 +281,34 @@ def run_app() -> None:
     level_list.set('Pick a level')
     level_list.pack()
 
-    dept_filter = ttk.Combobox(frame, values=list(departments), width=40)
+    dept_filter = ttk.Combobox(frame, values=[], width=40)
     dept_filter.set('Pick a department')
     dept_filter.pack()
 
-    search_button = tk.Button(frame, text="Search", command=retrieve)
+    search_button = tk.Button(frame, text="Search", command=retrieve, state=tk.DISABLED)
     search_button.pack(padx=5, pady=10)
 
-    root.mainloop()
+    progress = ttk.Progressbar(frame, mode='indeterminate', length=200)
+    progress.pack()
+
+    status = tk.StringVar()
+    status_label = tk.Label(frame, textvariable=status, wraplength=280)
+    status_label.pack()
+
+    status.set('Loading the course catalog...')
+    progress.start()
+    tasks.start(load_catalog, loaded)
+    return root
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['tkinter', 'data_formatting', 'data_filtering', 'visualizing_graph'],
+        'extra-imports': ['importlib', 'queue', 'tkinter', 'concurrent.futures',
+                          'course_search', 'data_formatting', 'data_filtering',
+                          'visualizing_graph'],
         'allowed-io': [],
         'max-line-length': 100,
-        'disable': ['E1136']
+        'disable': ['E1136', 'C0415']
     })
@@ -0,0 +1,230 @@
+"""CSC111 Project: University of Toronto Course Finder: Instrumentation
+
+Module Description:
+====================
+The module contains lightweight instrumentation for the hot paths of the course finder: timing
+spans around each stage (loading the catalog, building graphs, laying them out, building figures)
+and counters such as the number of vertices drawn or of cache hits.
+
+Nothing is recorded unless a capture is active, and spans and counters cost a single check when it
+is not. To find out where the time of a query went, either wrap it in a capture:
+
+    with capture() as report:
+        prereq_figure('CSC263H1')
+    print(format_report(report))
+
+or set the COURSE_FINDER_PROFILE environment variable to a comma-separated list of 'spans',
+'cprofile' and 'memory' before starting the GUI, the query service or the batch export, to dump
+the stage timings (and a cProfile or tracemalloc capture) of every request to stderr.
+"""
+
+from __future__ import annotations
+import contextlib
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from typing import Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+PROFILE_ENV = 'COURSE_FINDER_PROFILE'
+PROFILE_MODES = ('spans', 'cprofile', 'memory')
+# the number of functions and allocation sites listed in reports
+REPORT_LINES = 15
+
+# the report of the active capture (None when nothing is recorded), and the modes in which
+# requests are captured and dumped
+_STATE = {'capture': None,
+          'modes': frozenset(mode.strip() for mode in os.environ.get(PROFILE_ENV, '').split(',')
+                             if mode.strip() in PROFILE_MODES)}
+
+
+class _Span:
+    """A timing span being recorded into the report of a capture.
+
+    Instance Attributes:
+        - report: the report the span is recorded into
+        - name: the name of the stage
+        - start: the time the span started, from time.perf_counter
+    """
+    report: Dict
+    name: str
+    start: float
+
+    def __init__(self, report: Dict, name: str) -> None:
+        self.report = report
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.report['depth'] += 1
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info: object) -> None:
+        seconds = time.perf_counter() - self.start
+        self.report['depth'] -= 1
+        self.report['spans'].append((self.start, self.report['depth'], self.name, seconds))
+
+
+# what span returns when nothing is recorded
+_NO_SPAN = contextlib.nullcontext()
+
+
+def span(name: str) -> ContextManager:
+    """Return a context manager that records the time spent in it as the stage name, if a capture
+    is active.
+    """
+    report = _STATE['capture']
+    if report is None:
+        return _NO_SPAN
+    return _Span(report, name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Return a decorator that records every call of the decorated function as the stage name,
+    if a capture is active.
+    """
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args: object, **kwargs: object) -> object:
+            report = _STATE['capture']
+            if report is None:
+                return func(*args, **kwargs)
+            with _Span(report, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Add amount to the counter name, if a capture is active."""
+    report = _STATE['capture']
+    if report is not None:
+        report['counters'][name] = report['counters'].get(name, 0) + amount
+
+
+@contextlib.contextmanager
+def capture(profile: bool = False, memory: bool = False) -> Iterator[Dict]:
+    """Record the spans and counters of everything run inside the context into a report, which
+    is yielded and filled in when the context exits. The report is a dictionary with keys:
+        - 'seconds': the total time spent in the context
+        - 'spans': the recorded spans, as (start, depth, name, seconds) tuples in the order they
+            ended
+        - 'counters': the counters, mapped to their totals
+        - 'profile': if profile, the cProfile statistics of the context as text
+        - 'memory': if memory, the peak memory allocated in the context in bytes, and the sites
+            that allocated the most memory still held at the end, as (site, bytes) pairs
+
+    Captures can be nested; the inner one records on its own until it exits. Spans and counters
+    from every thread are recorded into the active capture.
+    """
+    report = {'seconds': 0.0, 'spans': [], 'counters': {}, 'depth': 0}
+    previous = _STATE['capture']
+    _STATE['capture'] = report
+    profiler = cProfile.Profile() if profile else None
+    tracing = memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield report
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        report['seconds'] = time.perf_counter() - start
+        _STATE['capture'] = previous
+        del report['depth']
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            allocations = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            if tracing:
+                tracemalloc.stop()
+            report['memory'] = {'peak_bytes': peak,
+                                'top': [(str(stat.traceback), stat.size_diff)
+                                        for stat in allocations[:REPORT_LINES]]}
+        if profiler is not None:
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(REPORT_LINES)
+            report['profile'] = text.getvalue()
+
+
+def request(name: str) -> ContextManager:
+    """Return a context manager for handling one request (such as showing a graph or answering a
+    query). It is recorded as the stage name, and if profiling was turned on with the
+    COURSE_FINDER_PROFILE environment variable (see set_profile_modes), the request is captured on
+    its own and its report is written to stderr.
+    """
+    if not _STATE['modes'] or _STATE['capture'] is not None:
+        return span(name)
+    return _dumped_request(name)
+
+
+@contextlib.contextmanager
+def _dumped_request(name: str) -> Iterator[None]:
+    """Capture the request name in the current profiling modes and write its report to stderr."""
+    report = None
+    try:
+        with capture('cprofile' in _STATE['modes'], 'memory' in _STATE['modes']) as report:
+            with span(name):
+                yield
+    finally:
+        # failed requests are reported too, they are often the slow ones
+        if report is not None:
+            print(format_report(report), file=sys.stderr)
+
+
+def set_profile_modes(modes: Optional[List[str]]) -> None:
+    """Set the modes in which requests are captured and dumped, out of PROFILE_MODES, overriding
+    the COURSE_FINDER_PROFILE environment variable. Requests are not captured if modes is None or
+    empty.
+
+    Raise ValueError if a mode is not in PROFILE_MODES.
+    """
+    for mode in modes or []:
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'unknown profile mode {mode!r}, expected one of {PROFILE_MODES}')
+    _STATE['modes'] = frozenset(modes or [])
+
+
+def stage_totals(report: Dict) -> Dict[str, Tuple[int, float]]:
+    """Return the number of spans and the total seconds of each stage in report."""
+    totals = {}
+    for _, _, name, seconds in report['spans']:
+        calls, total = totals.get(name, (0, 0.0))
+        totals[name] = (calls + 1, total + seconds)
+    return totals
+
+
+def format_report(report: Dict) -> str:
+    """Return a human-readable summary of the report of a capture."""
+    lines = [f'total {report["seconds"] * 1000:.1f}ms']
+    for _, depth, name, seconds in sorted(report['spans']):
+        lines.append(f'{"  " * (depth + 1)}{name}: {seconds * 1000:.1f}ms')
+    for name, value in sorted(report['counters'].items()):
+        lines.append(f'  {name} = {value}')
+    if 'memory' in report:
+        lines.append(f'  peak memory {report["memory"]["peak_bytes"] / 1e6:.2f}MB, held by:')
+        lines.extend(f'    {site}: {size / 1e3:+.1f}kB' for site, size in report['memory']['top'])
+    if 'profile' in report:
+        lines.append(report['profile'])
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['contextlib', 'cProfile', 'functools', 'io', 'os', 'pstats', 'sys',
+                          'time', 'tracemalloc'],
+        'allowed-io': ['_dumped_request'],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
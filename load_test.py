@@ -0,0 +1,128 @@
+"""CSC111 Project: University of Toronto Course Finder: Load Test
+
+Module Description:
+====================
+The module contains a load test for the query service (see query_service.py). It sends
+prerequisite, future course and filtering queries for random courses of the catalog from many
+concurrent keep-alive connections, and reports the latency percentiles and throughput.
+
+Start the service first, then run for example:
+
+    python load_test.py --port 8111 --connections 32 --requests 5000
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+# the share of each kind of query in the load
+QUERY_MIX = {'prereq': 0.5, 'future': 0.3, 'courses': 0.2}
+LEVELS = ['', '1', '2', '3', '4']
+
+
+async def fetch(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                target: str) -> Tuple[int, bytes]:
+    """Send a GET request for target over an open keep-alive connection and return the status
+    and body of the response.
+    """
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+def make_targets(courses: List[str], count: int, seed: int = 0) -> List[str]:
+    """Return count random query targets over the given course codes, following QUERY_MIX."""
+    rng = random.Random(seed)
+    kinds = rng.choices(list(QUERY_MIX), weights=list(QUERY_MIX.values()), k=count)
+    targets = []
+    for kind in kinds:
+        if kind == 'prereq':
+            targets.append(f'/prereq?course={quote(rng.choice(courses))}')
+        elif kind == 'future':
+            targets.append(f'/future?course={quote(rng.choice(courses))}'
+                           f'&level={rng.choice(LEVELS)}')
+        else:
+            targets.append(f'/courses?level={rng.choice(LEVELS)}')
+    return targets
+
+
+async def run_load(host: str, port: int, connections: int, requests: int,
+                   seed: int = 0) -> Dict[str, float]:
+    """Send requests queries to the service on host and port over connections concurrent
+    connections, and return the latency percentiles (in milliseconds), the throughput and the
+    number of failed queries.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    status, body = await fetch(reader, writer, '/courses')
+    writer.close()
+    if status != 200:
+        raise RuntimeError(f'the service answered /courses with status {status}')
+    targets = make_targets(json.loads(body)['courses'], requests, seed)
+
+    latencies = []
+    failures = 0
+
+    async def client(mine: List[str]) -> None:
+        nonlocal failures
+        client_reader, client_writer = await asyncio.open_connection(host, port)
+        try:
+            for target in mine:
+                sent = time.perf_counter()
+                client_status, _ = await fetch(client_reader, client_writer, target)
+                latencies.append(time.perf_counter() - sent)
+                failures += int(client_status != 200)
+        finally:
+            client_writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(targets[i::connections]) for i in range(connections)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {'requests': len(latencies), 'failures': failures, 'seconds': seconds,
+            'requests_per_second': len(latencies) / seconds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000}
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    """Return the given percentile of the sorted, non-empty list ordered (nearest rank)."""
+    rank = max(int(len(ordered) * percent / 100 + 0.5), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the load test with the options given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address of the service')
+    parser.add_argument('--port', type=int, default=8111, help='port of the service')
+    parser.add_argument('--connections', type=int, default=32, help='concurrent connections')
+    parser.add_argument('--requests', type=int, default=2000, help='total number of queries')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random queries')
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_load(args.host, args.port, args.connections, args.requests,
+                                  args.seed))
+    print(f"{result['requests']} requests ({result['failures']} failed) in "
+          f"{result['seconds']:.2f}s: {result['requests_per_second']:.1f} req/s, "
+          f"p50 {result['p50_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms, "
+          f"max {result['max_ms']:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
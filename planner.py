@@ -0,0 +1,217 @@
+"""CSC111 Project: University of Toronto Course Finder: Planner
+
+Module Description:
+====================
+The module contains the planner that finds a smallest set of additional courses a student needs
+before they can take a target course, given the courses they have completed, and orders them into
+terms.
+
+The planner works on the and/or requisite trees of the catalog, the same structure that
+convert_tree turns into the requisite graphs: an 'and' node needs all of its children and an 'or'
+node needs any one of them. The courses needed for each course are computed once per plan with
+memoized dynamic programming; every 'or' node picks its cheapest option, and courses shared
+between the children of an 'and' node are only counted once. (Finding the true minimum when the
+options of different 'or' nodes overlap is NP-hard, so a plan can occasionally be a little larger
+than the smallest possible one.)
+
+Prerequisite cycles in the catalog are detected, reported and routed around. Corequisites that
+lead back to a course already being planned are taken in the same term as it.
+"""
+
+from __future__ import annotations
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from PrereqTree_class import PrereqTree
+
+# the credits of a half (H) and full year (Y) course
+CREDITS = {'H': 0.5, 'Y': 1.0}
+
+# no cycle was cut while computing a result, see _PlanSearch.need
+_NO_CUT = float('inf')
+
+
+def plan_course(courses: Dict[str, Dict], target: str, completed: Iterable[str] = (),
+                weighted: bool = False, corequisites: bool = True) -> Dict:
+    """Return a plan for taking the course target, given the completed courses. The plan is a
+    dictionary with the following keys:
+        - 'courses': the codes of the additional courses needed before or alongside target, sorted
+        - 'credits': the total credits of those courses
+        - 'terms': the courses of the plan and target grouped into terms, where every course comes
+            after its prerequisites and no earlier than its corequisites
+        - 'cycles': the requisite cycles found while planning, as lists of course codes
+
+    The plan minimizes the number of courses, or their credits (H courses count 0.5 and Y courses
+    1.0) if weighted. Corequisites are planned too, unless corequisites is False.
+
+    Raise ValueError if target is not in courses, or if it cannot be taken because all of its
+    requisite options are cyclic.
+    """
+    if target not in courses:
+        raise ValueError(f'no such course {target}')
+    # target is planned even if it has been completed before
+    search = _PlanSearch(courses, set(completed) - {target}, weighted, corequisites)
+    needed, _ = search.need(target)
+    if needed is None:
+        raise ValueError(f'{target} cannot be taken, its requisites are cyclic: {search.cycles}')
+
+    plan = needed - {target}
+    return {'courses': sorted(plan), 'credits': sum(credits(code) for code in plan),
+            'terms': order_terms(needed | {target}, search.choices), 'cycles': search.cycles}
+
+
+def credits(code: str) -> float:
+    """Return the credits of the course code."""
+    return CREDITS.get(code[6], CREDITS['H'])
+
+
+def order_terms(plan: Set[str], choices: Dict[str, Tuple[Set[str], Set[str]]]
+                ) -> List[List[str]]:
+    """Return the courses in plan grouped into terms, each as a sorted list, so that each course is
+    in a later term than its chosen prerequisites and in the same or a later term than its chosen
+    corequisites, as given by choices. Courses are put in the earliest term possible.
+
+    Raise ValueError if there is no such grouping, i.e. the chosen requisites are cyclic.
+    """
+    terms = {code: 0 for code in plan}
+    for _ in range(len(plan) + 1):
+        changed = False
+        for code in plan:
+            prereqs, coreqs = choices.get(code, (set(), set()))
+            term = max([0] + [terms[prereq] + 1 for prereq in prereqs if prereq in terms]
+                       + [terms[coreq] for coreq in coreqs if coreq in terms])
+            if term != terms[code]:
+                terms[code] = term
+                changed = True
+        if not changed:
+            break
+    else:
+        raise ValueError('the chosen requisites are cyclic')
+
+    grouped = [[] for _ in range(max(terms.values(), default=-1) + 1)]
+    for code, term in terms.items():
+        grouped[term].append(code)
+    return [sorted(term) for term in grouped]
+
+
+class _PlanSearch:
+    """The memoized search for the courses needed to take each course, for one plan.
+
+    Instance Attributes:
+        - courses: the catalog
+        - completed: the codes of the completed courses
+        - weighted: whether options are compared by credits rather than number of courses
+        - corequisites: whether corequisites are planned
+        - memo: the courses needed to take each course whose result does not depend on a cycle
+            being cut (None if the course cannot be taken)
+        - choices: the prerequisites and corequisites chosen for each course
+        - stack: the courses being planned, mapped to their depth in the search
+        - cycles: the requisite cycles found so far
+    """
+    courses: Dict[str, Dict]
+    completed: Set[str]
+    weighted: bool
+    corequisites: bool
+    memo: Dict[str, Optional[FrozenSet[str]]]
+    choices: Dict[str, Tuple[Set[str], Set[str]]]
+    stack: Dict[str, int]
+    cycles: List[List[str]]
+
+    def __init__(self, courses: Dict[str, Dict], completed: Set[str], weighted: bool,
+                 corequisites: bool) -> None:
+        self.courses = courses
+        self.completed = completed
+        self.weighted = weighted
+        self.corequisites = corequisites
+        self.memo = {}
+        self.choices = {}
+        self.stack = {}
+        self.cycles = []
+
+    def need(self, code: str) -> Tuple[Optional[FrozenSet[str]], float]:
+        """Return the courses needed to take code, including code itself unless it has been
+        completed, or None if it cannot be taken. Also return the smallest depth of a course on
+        the stack whose cycle was cut to compute the result, or _NO_CUT; results that depend on a
+        cut are not memoized, since they depend on the path the search took.
+        """
+        if code in self.completed:
+            return frozenset(), _NO_CUT
+        if code in self.memo:
+            return self.memo[code], _NO_CUT
+        if code in self.stack:
+            cycle = list(self.stack)[self.stack[code]:] + [code]
+            if cycle not in self.cycles:
+                self.cycles.append(cycle)
+            return None, self.stack[code]
+
+        depth = len(self.stack)
+        self.stack[code] = depth
+        course = self.courses.get(code)
+        if course is None:
+            # courses outside the catalog (e.g. from other campuses) have no known requisites
+            prereqs, prereq_cut, prereq_choice = frozenset(), _NO_CUT, set()
+            coreqs, coreq_cut, coreq_choice = frozenset(), _NO_CUT, set()
+        else:
+            prereqs, prereq_cut, prereq_choice = self.need_tree(course['prereq_tree'], False)
+            if self.corequisites:
+                coreqs, coreq_cut, coreq_choice = self.need_tree(course['coreq_tree'], True)
+            else:
+                coreqs, coreq_cut, coreq_choice = frozenset(), _NO_CUT, set()
+        del self.stack[code]
+
+        if prereqs is None or coreqs is None:
+            needed = None
+        else:
+            needed = prereqs | coreqs | {code}
+        self.choices[code] = (prereq_choice, coreq_choice)
+        cut = min(prereq_cut, coreq_cut)
+        if cut >= depth:
+            self.memo[code] = needed
+            cut = _NO_CUT
+        return needed, cut
+
+    def need_tree(self, tree: Optional[PrereqTree], coreq: bool
+                  ) -> Tuple[Optional[FrozenSet[str]], float, Set[str]]:
+        """Return the courses needed to satisfy tree (None if it cannot be satisfied), the
+        smallest depth of a cut cycle as in need, and the courses chosen directly in tree.
+        coreq is whether tree is a corequisite tree.
+        """
+        if tree is None or (tree.subtrees == [] and tree.item == ''):
+            return frozenset(), _NO_CUT, set()
+        if tree.subtrees == []:
+            if coreq and tree.item in self.stack:
+                # the course is already being planned, so both can be taken in the same term
+                return frozenset(), _NO_CUT, {tree.item}
+            needed, cut = self.need(tree.item)
+            return needed, cut, {tree.item}
+
+        options = [self.need_tree(subtree, coreq) for subtree in tree.subtrees]
+        cut = min(option[1] for option in options)
+        if tree.item == 'and':
+            if any(option[0] is None for option in options):
+                return None, cut, set()
+            return frozenset().union(*(option[0] for option in options)), cut, \
+                set().union(*(option[2] for option in options))
+
+        feasible = [option for option in options if option[0] is not None]
+        if feasible == []:
+            return None, cut, set()
+        best = min(feasible, key=lambda option: self.cost(option[0]))
+        return best[0], cut, best[2]
+
+    def cost(self, needed: FrozenSet[str]) -> Tuple[float, int, List[str]]:
+        """Return the cost of taking the courses in needed, as a key for comparing options: the
+        credits (if weighted) or number of courses, then the courses themselves to break ties.
+        """
+        if self.weighted:
+            return sum(credits(code) for code in needed), len(needed), sorted(needed)
+        return len(needed), len(needed), sorted(needed)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['PrereqTree_class'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -5,62 +5,279 @@ Module Description:
 The module contains the functions that generate the 'prereq graphs' for a given course.
 """
 
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
 import networkx as nx
+from data_filtering import bit_positions
+from data_formatting import tree_graph
+from instrumentation import count, span, timed
+from traversal import find_cycles, traverse, traverse_from
 
+# the maximum number of trace graphs kept in memory
+TRACE_CACHE_SIZE = 256
 
-def build_trace_graph(courses: Dict[str, Dict], course: str) -> nx.DiGraph():
-    """Returns the prereq/coreq trace subgraph of the given course."""
-    prereq_tree = courses[course]['prereq_tree']
-    coreq_tree = courses[course]['coreq_tree']
-    # if both prereq_tree and coreq_tree are None, then graph is set to an empty graph
-    graph = nx.compose_all([tree for tree in [prereq_tree, coreq_tree, nx.DiGraph()]
-                            if tree is not None])
+# the global requisite graph of the catalog it was built from, and the trace graphs computed
+# from it so far, in least to most recently used order
+_STATE = {'courses': None, 'graph': None, 'traces': OrderedDict()}
 
-    for vertex in graph.nodes(data=True):
-        # recursive base case is when the only node in graph has course as its item
-        if vertex[1]['type'] == 'course' and vertex[0] != course and vertex[0] in courses:
-            prereq_graph = build_trace_graph(courses, vertex[0])
-            graph = nx.compose(graph, prereq_graph)
 
+@timed('trace.build')
+def build_trace_graph(courses: Dict[str, Dict], course: str, max_depth: Optional[int] = None,
+                      max_nodes: Optional[int] = None, seconds: Optional[float] = None
+                      ) -> nx.DiGraph():
+    """Returns the prereq/coreq trace subgraph of the given course.
+
+    The traversal can be limited to vertices at most max_depth edges away from course (each
+    connective counts as a level), to max_nodes vertices and to the given number of seconds, see
+    traversal.traverse. The 'truncated' graph attribute of the result says whether a limit was
+    reached, and its 'cycles' attribute lists the course codes of the requisite cycles in it.
+    """
+    traces = _STATE['traces']
+    if _STATE['courses'] is courses and course in traces \
+            and within_budget(traces[course], max_depth, max_nodes):
+        traces.move_to_end(course)
+        count('trace.cache_hits')
+        return traces[course].copy()
+    count('trace.cache_misses')
+
+    graph = requisite_graph(courses)
+    if courses[course]['prereq_tree'] is None and courses[course]['coreq_tree'] is None:
+        # if both prereq_tree and coreq_tree are None, then the trace graph is empty
+        result = {'depths': {}, 'depth': 0, 'backward': False, 'truncated': False}
+    else:
+        # the trace graph is the course together with everything it (indirectly) requires
+        result = traverse(course, graph.successors, max_depth, max_nodes, seconds)
+    trace = graph.subgraph(result['depths']).copy()
+
+    for vertex in trace.nodes:
         # mark original searched course so it can be colored distinctively
-        if vertex[0] == course:
-            graph.nodes[vertex[0]]['tag'] = 'original'
-        else:
-            graph.nodes[vertex[0]]['tag'] = 'no'
+        trace.nodes[vertex]['tag'] = 'original' if vertex == course else 'no'
+    # redundant connectives were already collapsed by convert_tree, so trace is minimal
+    # a truncated trace also has the edges out of the vertices that were not expanded, which
+    # the traversal did not check
+    if result['backward'] or result['truncated']:
+        cycles = find_cycles(trace, lambda vertex: trace.nodes[vertex]['type'] == 'course')
+    else:
+        cycles = []
+    trace.graph.update(depth=result['depth'], truncated=result['truncated'], cycles=cycles)
+
+    count('trace.nodes', len(trace))
+    count('trace.edges', trace.number_of_edges())
+    if not result['truncated']:
+        # only complete traces are kept, a truncated one depends on the limits it was built with
+        traces[course] = trace
+        if len(traces) > TRACE_CACHE_SIZE:
+            traces.popitem(last=False)
+    return trace.copy()
+
+
+@timed('trace.union')
+def build_union_trace_graph(courses: Dict[str, Dict], targets: Sequence[str],
+                            max_depth: Optional[int] = None, max_nodes: Optional[int] = None,
+                            seconds: Optional[float] = None) -> nx.DiGraph:
+    """Return the union of the trace graphs of the courses in targets (such as the required
+    courses of a program), built in a single traversal that expands the requisites shared by
+    several targets only once.
+
+    Every vertex has a 'targets' attribute listing the targets that need it, in the order of
+    targets, and the targets are tagged 'original'. Unlike in build_trace_graph, a target without
+    requisites is still a vertex. The limits and the 'truncated' and 'cycles' graph attributes
+    are as in build_trace_graph, and the 'targets' graph attribute lists the targets.
+
+    Raise ValueError if a target is not in courses.
+    """
+    targets = list(dict.fromkeys(targets))
+    missing = [code for code in targets if code not in courses]
+    if missing != []:
+        raise ValueError(f'no such courses {", ".join(missing)}')
+
+    graph = requisite_graph(courses)
+    starts = [code for code in targets if code in graph]
+    result = traverse_from(starts, graph.successors, max_depth, max_nodes, seconds)
+    union = graph.subgraph(result['depths']).copy()
+    union.add_nodes_from(((code, {'value': code}) for code in targets if code not in union),
+                         type='course')
+
+    # the edges out of the vertices that were not expanded may close a cycle too, see
+    # build_trace_graph
+    if result['backward'] or result['truncated']:
+        cycles = find_cycles(union, lambda vertex: union.nodes[vertex]['type'] == 'course')
+    else:
+        cycles = []
+
+    target_bits = {code: 1 << i for i, code in enumerate(targets)}
+    for vertex, need in _needed_by(union, target_bits, cycles == []).items():
+        # mark the targets so they can be colored distinctively
+        union.nodes[vertex]['tag'] = 'original' if vertex in target_bits else 'no'
+        union.nodes[vertex]['targets'] = [targets[i] for i in bit_positions(need)]
+    union.graph.update(depth=result['depth'], truncated=result['truncated'], cycles=cycles,
+                       targets=targets)
+    count('trace.union_targets', len(targets))
+    count('trace.nodes', len(union))
+    count('trace.edges', union.number_of_edges())
+    return union
+
+
+def _needed_by(graph: nx.DiGraph, target_bits: Dict[str, int], acyclic: bool
+               ) -> Dict[str, int]:
+    """Return the bitset of the targets that need each vertex of graph, i.e. that it can be
+    reached from, given the bit of each target in target_bits. acyclic is whether graph is known
+    to have no cycles, including through edges the traversal did not follow; otherwise the
+    vertices of each cycle, which can all reach each other, are handled together as a strongly
+    connected component.
+    """
+    if acyclic:
+        bits = {}
+        for vertex in nx.topological_sort(graph):
+            need = target_bits.get(vertex, 0)
+            for parent in graph.predecessors(vertex):
+                need |= bits[parent]
+            bits[vertex] = need
+        return bits
+
+    condensed = nx.condensation(graph)
+    members = condensed.nodes(data='members')
+    component_bits = {}
+    for component in nx.topological_sort(condensed):
+        need = 0
+        for vertex in members[component]:
+            need |= target_bits.get(vertex, 0)
+        for parent in condensed.predecessors(component):
+            need |= component_bits[parent]
+        component_bits[component] = need
+    return {vertex: component_bits[component]
+            for vertex, component in condensed.graph['mapping'].items()}
 
-    remove_redundant_connectives(graph)
 
-    return graph
+def within_budget(trace: nx.DiGraph, max_depth: Optional[int], max_nodes: Optional[int]) -> bool:
+    """Return whether the complete trace graph trace fits within the limits max_depth and
+    max_nodes of build_trace_graph, so that it is also the answer under those limits.
+    """
+    return (max_depth is None or trace.graph['depth'] <= max_depth) \
+        and (max_nodes is None or len(trace) <= max_nodes)
 
 
+def requisite_graph(courses: Dict[str, Dict]) -> nx.DiGraph:
+    """Return the global requisite graph of courses, i.e. the union of the prerequisite and
+    corequisite trees of all the courses. The graph is only built once for each catalog.
+    """
+    if _STATE['courses'] is not courses:
+        with span('trace.requisite_graph'):
+            graph = nx.DiGraph()
+            for data in courses.values():
+                for tree in (tree_graph(data, 'pre'), tree_graph(data, 'co')):
+                    if tree is not None:
+                        graph.add_nodes_from(tree.nodes(data=True))
+                        graph.add_edges_from(tree.edges(data=True))
+        _STATE['courses'] = courses
+        _STATE['graph'] = graph
+        _STATE['traces'].clear()
+    return _STATE['graph']
+
+
+def update_requisite_graph(courses: Dict[str, Dict],
+                           changes: Dict[str, Tuple[Optional[Dict], Optional[Dict]]]) -> None:
+    """Patch the global requisite graph of courses in place to account for changes, in the format
+    returned by data_formatting.update_courses_data, and forget the cached trace graphs that
+    contain a changed course. Does nothing if the graph of courses has not been built.
+    """
+    if _STATE['courses'] is not courses:
+        return
+    graph = _STATE['graph']
+
+    # vertices that may no longer belong in the graph once the old trees are removed
+    candidates = set()
+    for code, (old, _) in changes.items():
+        if old is None:
+            continue
+        for tree in (tree_graph(old, 'pre'), tree_graph(old, 'co')):
+            if tree is not None:
+                graph.remove_nodes_from([node for node, kind in tree.nodes(data='type')
+                                         if kind == 'connective'])
+                candidates.update(tree.nodes)
+        if code in graph:
+            # the only edges out of a course are the ones to the roots of its own trees
+            graph.remove_edges_from(list(graph.out_edges(code)))
+
+    for _, new in changes.values():
+        if new is None:
+            continue
+        for tree in (tree_graph(new, 'pre'), tree_graph(new, 'co')):
+            if tree is not None:
+                graph.add_nodes_from(tree.nodes(data=True))
+                graph.add_edges_from(tree.edges(data=True))
+
+    for node in candidates:
+        # requisite graph vertices are courses with requisites and courses that are requisites
+        if node in graph and graph.degree(node) == 0 and \
+                (node not in courses or (courses[node]['prereq_tree'] is None
+                                         and courses[node]['coreq_tree'] is None)):
+            graph.remove_node(node)
+
+    traces = _STATE['traces']
+    for course in list(traces):
+        # a trace graph only depends on the courses in it, and on the searched course itself
+        if course in changes or any(code in traces[course] for code in changes):
+            del traces[course]
+
+
+def clear_cache() -> None:
+    """Forget the global requisite graph and every cached trace graph."""
+    _STATE['courses'] = None
+    _STATE['graph'] = None
+    _STATE['traces'].clear()
+
+
+@timed('trace.simplify')
 def remove_redundant_connectives(graph: nx.DiGraph) -> None:
-    """Mutate graph to remove redundant connectives i.e. those that only lead to one course"""
-    removable_nodes = []
+    """Mutate graph to remove redundant connectives i.e. those that lead to at most one course or
+    connective once their own redundant successors are removed. Whole chains of redundant
+    connectives are collapsed, in time linear in the size of graph.
+
+    Graphs built from convert_tree are already minimal; this is for graphs put together in other
+    ways.
+    """
+    resolved = {}
     for vertex in list(graph.nodes):
         # for each successor of vertex
         for neighbour in list(graph.successors(vertex)):
-            # if the neighbour is a redundant connective
-            if graph.nodes[neighbour]['type'] == 'connective' and graph.out_degree(neighbour) == 0:
-                removable_nodes.append(neighbour)
-            if graph.nodes[neighbour]['type'] == 'connective' and graph.out_degree(neighbour) == 1:
-                # by definition, neighbour only has one neighbour
-                neighbour_neighbour = list(graph.successors(neighbour))[0]
-
-                # create an edge (vertex, neighbour_neighbour), bypassing the redundant connective
+            target = _resolve(graph, neighbour, resolved)
+            if target != neighbour:
+                # bypass the redundant connective, keeping the type of the edge to it
                 edge_type = graph.get_edge_data(vertex, neighbour)['edge_type']
-                graph.add_edge(vertex, neighbour_neighbour, edge_type=edge_type)
+                graph.remove_edge(vertex, neighbour)
+                if target is not None and target != vertex:
+                    graph.add_edge(vertex, target, edge_type=edge_type)
+    graph.remove_nodes_from([node for node, target in resolved.items() if target != node])
+
+
+def _resolve(graph: nx.DiGraph, node: str, resolved: Dict[str, Optional[str]]) -> Optional[str]:
+    """Return the vertex that edges into node should lead to once redundant connectives are
+    removed: node itself, the only vertex a redundant connective leads to, or None if it leads
+    nowhere. Results are memoized in resolved.
+    """
+    if node in resolved:
+        return resolved[node]
+    if graph.nodes[node]['type'] != 'connective':
+        return node
 
-                # add the redundant connective to the list of nodes to be removed
-                removable_nodes.append(neighbour)
-    graph.remove_nodes_from(removable_nodes)
+    resolved[node] = node  # guards against cycles of connectives
+    targets = {}
+    for successor in graph.successors(node):
+        target = _resolve(graph, successor, resolved)
+        if target is not None:
+            targets[target] = None
+    if len(targets) <= 1:
+        resolved[node] = next(iter(targets), None)
+    return resolved[node]
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['networkx'],
+        'extra-imports': ['collections', 'networkx', 'data_filtering', 'data_formatting',
+                          'instrumentation', 'traversal'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['E1136']
@@ -0,0 +1,285 @@
+"""CSC111 Project: University of Toronto Course Finder: Query Service
+
+Module Description:
+====================
+The module contains a local HTTP service that answers prerequisite, future course and filtering
+queries as JSON, keeping the catalog, its indexes and its requisite graph in memory.
+
+Endpoints (all GET):
+    - /prereq?course=CSC263H1: the prerequisite trace graph of a course
+    - /future?course=CSC108H1&level=3&department=...&breadth=...: the future graph of a course,
+        over the courses that pass the (optional) filters
+    - /program?courses=CSC108H1,CSC148H1,...: the union of the prerequisite trace graphs of
+        several courses, whose vertices list the 'targets' that need them
+    - /courses?level=3&department=...&breadth=...: the codes of the courses that pass the filters
+    - /search?q=data+struct&limit=10: the courses whose codes or names start with or are close to
+        the query, best first; with complete=1, only the courses that the query is the start of
+    - /health: the number of courses loaded and of requests served and coalesced
+
+The graphs can be limited with max_depth and max_nodes parameters, and are cut short after
+INTERACTIVE_SECONDS seconds; their responses also say whether they were 'truncated' and list the
+requisite 'cycles' found.
+
+Identical queries that arrive while one is being computed share its result, and the graphs are
+computed on a worker thread so that the event loop keeps accepting connections. For example:
+
+    python query_service.py --port 8111
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import networkx as nx
+from course_search import RESULT_LIMIT, complete, get_search_index, search
+from data_filtering import filter_courses, get_indexes
+from data_formatting import COURSES_FILE, get_courses_data
+from future_graph import future
+from instrumentation import request
+from prereq_graph import build_trace_graph, build_union_trace_graph, requisite_graph
+from traversal import INTERACTIVE_SECONDS
+
+ENDPOINTS = ('/prereq', '/future', '/program', '/courses', '/search', '/health')
+# the longest request line or header accepted, in bytes
+MAX_LINE = 8192
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class QueryService:
+    """An HTTP service answering queries about a catalog kept in memory.
+
+    Queries run on a single worker thread, since the caches of the graph and filtering modules
+    are not thread-safe; the event loop only parses requests and writes responses.
+
+    Instance Attributes:
+        - courses: the catalog, as returned by get_courses_data
+        - executor: the thread the queries are computed on
+        - in_flight: the queries being computed, mapped to the future of their response
+        - stats: the number of queries answered ('requests') and of queries that shared the
+            response of an identical concurrent query ('coalesced')
+    """
+    courses: Dict[str, Dict]
+    executor: ThreadPoolExecutor
+    in_flight: Dict[tuple, asyncio.Future]
+    stats: Dict[str, int]
+
+    def __init__(self, courses: Dict[str, Dict]) -> None:
+        self.courses = courses
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = {}
+        self.stats = {'requests': 0, 'coalesced': 0}
+
+    async def warm_up(self) -> None:
+        """Build the indexes, the search index and the requisite graph of the catalog ahead of
+        the first query.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, get_indexes, self.courses)
+        await loop.run_in_executor(self.executor, get_search_index, self.courses)
+        await loop.run_in_executor(self.executor, requisite_graph, self.courses)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer the requests sent over one connection, until the client closes it."""
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, keep_alive = request
+                if method != 'GET':
+                    status, body = 405, error_body('only GET requests are supported')
+                else:
+                    status, body = await self.query(target)
+                writer.write(response_bytes(status, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # the client went away or sent something that is not HTTP
+        finally:
+            writer.close()
+
+    async def query(self, target: str) -> Tuple[int, bytes]:
+        """Return the status and JSON body of the response to the query in target, sharing the
+        response of an identical query that is already being computed.
+        """
+        url = urlsplit(target)
+        key = (url.path, tuple(sorted(parse_qsl(url.query))))
+        self.stats['requests'] += 1
+        if key in self.in_flight:
+            self.stats['coalesced'] += 1
+            response = self.in_flight[key]
+        else:
+            loop = asyncio.get_running_loop()
+            response = loop.run_in_executor(self.executor, self.answer, url.path, dict(key[1]))
+            self.in_flight[key] = response
+            response.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        try:
+            # shielded, so that a client hanging up does not cancel the query for the others
+            return await asyncio.shield(response)
+        except Exception as error:  # one broken query should not take the service down
+            return 500, error_body(f'{type(error).__name__}: {error}')
+
+    def answer(self, path: str, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """Return the status and JSON body of the response to a query. Runs on the worker
+        thread.
+        """
+        with request(f'query {path}'):
+            return self._answer(path, params)
+
+    def _answer(self, path: str, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """Return the status and JSON body of the response to a query, see answer."""
+        if path not in ENDPOINTS:
+            return 404, error_body(f'unknown endpoint {path}, expected one of '
+                                   f'{", ".join(ENDPOINTS)}')
+        if path == '/health':
+            return 200, json_body({'courses': len(self.courses), **self.stats})
+        if path == '/search':
+            return self._search(params)
+        try:
+            limits = {name: int(params[name]) for name in ('max_depth', 'max_nodes')
+                      if name in params}
+        except ValueError:
+            return 400, error_body('max_depth and max_nodes must be integers')
+        if path == '/program':
+            return self._program(params, limits)
+
+        view = filter_courses(self.courses, params.get('level', ''),
+                              params.get('department', ''), params.get('breadth', ''))
+        if path == '/courses':
+            return 200, json_body({'courses': list(view)})
+
+        course = params.get('course')
+        if course is None:
+            return 400, error_body('missing the course parameter')
+        if course not in self.courses:
+            return 404, json_body({'error': f'no such course {course}',
+                                   'suggestions': search(self.courses, course, 5)})
+        if path == '/prereq':
+            graph = build_trace_graph(self.courses, course, seconds=INTERACTIVE_SECONDS, **limits)
+        else:
+            graph = future(view, course, seconds=INTERACTIVE_SECONDS, **limits)
+        return 200, json_body(graph_data(graph))
+
+    def _program(self, params: Dict[str, str], limits: Dict[str, int]) -> Tuple[int, bytes]:
+        """Return the status and JSON body of the response to a /program query, whose graph is
+        limited by limits.
+        """
+        targets = [code.strip() for code in params.get('courses', '').split(',') if code.strip()]
+        if targets == []:
+            return 400, error_body('missing the courses parameter')
+        missing = [code for code in targets if code not in self.courses]
+        if missing != []:
+            return 404, error_body(f'no such courses {", ".join(missing)}')
+        graph = build_union_trace_graph(self.courses, targets, seconds=INTERACTIVE_SECONDS,
+                                        **limits)
+        return 200, json_body(graph_data(graph))
+
+    def _search(self, params: Dict[str, str]) -> Tuple[int, bytes]:
+        """Return the status and JSON body of the response to a /search query."""
+        try:
+            limit = int(params.get('limit', RESULT_LIMIT))
+        except ValueError:
+            return 400, error_body('limit must be an integer')
+        find = complete if params.get('complete') == '1' else search
+        codes = find(self.courses, params.get('q', ''), limit)
+        return 200, json_body({'courses': [{'code': code, 'name': self.courses[code].get('name')}
+                                           for code in codes]})
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bool]]:
+    """Read an HTTP request from reader and return its method, its target and whether the
+    connection should be kept open afterwards. Return None if the connection was closed before a
+    new request started. Request bodies are not supported.
+
+    Raise ValueError if the request is malformed.
+    """
+    request_line = await reader.readline()
+    if request_line == b'':
+        return None
+    if len(request_line) > MAX_LINE:
+        raise ValueError('request line too long')
+    method, target, version = request_line.decode('latin-1').split()
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if len(line) > MAX_LINE:
+            raise ValueError('header too long')
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+
+    if version == 'HTTP/1.0':
+        keep_alive = headers.get('connection') == 'keep-alive'
+    else:
+        keep_alive = headers.get('connection') != 'close'
+    return method, target, keep_alive
+
+
+def response_bytes(status: int, body: bytes, keep_alive: bool) -> bytes:
+    """Return the HTTP response with the given status and JSON body."""
+    head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+    return head.encode('latin-1') + body
+
+
+def json_body(data: object) -> bytes:
+    """Return data encoded as a JSON response body."""
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def error_body(message: str) -> bytes:
+    """Return the JSON response body of an error."""
+    return json_body({'error': message})
+
+
+def graph_data(graph: nx.Graph) -> Dict[str, list]:
+    """Return graph as a dictionary of JSON-serializable 'nodes' and 'edges' lists. Every node
+    has an 'id' and its attributes (such as 'type', 'value' and 'tag'), and every edge has a
+    'source', a 'target' and its attributes (such as 'edge_type'). Whether the graph was
+    'truncated' and its requisite 'cycles' are included too.
+    """
+    return {'nodes': [{'id': node, **data} for node, data in graph.nodes(data=True)],
+            'edges': [{'source': source, 'target': target, **data}
+                      for source, target, data in graph.edges(data=True)],
+            'truncated': graph.graph.get('truncated', False),
+            'cycles': graph.graph.get('cycles', [])}
+
+
+async def serve(host: str, port: int, path: str = COURSES_FILE) -> None:
+    """Load the catalog in path and answer queries on host and port until cancelled."""
+    service = QueryService(get_courses_data(path))
+    await service.warm_up()
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f'serving {len(service.courses)} courses on http://{host}:{port}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the query service with the options given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8111, help='port to listen on')
+    parser.add_argument('--catalog', default=COURSES_FILE, help='courses file to load')
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.catalog))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""CSC111 Project: University of Toronto Course Finder: Traversal
+
+Module Description:
+====================
+The module contains the breadth-first traversal shared by the prerequisite trace graphs and the
+future graphs.
+
+The traversal keeps an explicit queue and visited set rather than recursing, so requisite cycles
+in the catalog (such as mutual corequisites, or a course cross-listed as its own prerequisite)
+are reported instead of followed forever, and long chains of prerequisites cannot exhaust the
+stack. It can also be given a budget: a maximum depth, a maximum number of vertices and a number
+of seconds, after which it stops and flags its result as truncated, so that one bad catalog entry
+cannot hang an interactive request.
+"""
+
+from __future__ import annotations
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional
+import networkx as nx
+from instrumentation import count
+
+# the time budget of the graphs computed for the GUI and the query service, in seconds
+INTERACTIVE_SECONDS = 2.0
+# how many vertices are expanded between two checks of the time budget
+CLOCK_INTERVAL = 64
+
+
+def traverse(start: Hashable, successors: Callable[[Hashable], Iterable[Hashable]],
+             max_depth: Optional[int] = None, max_nodes: Optional[int] = None,
+             seconds: Optional[float] = None) -> Dict:
+    """Return the vertices reachable from start, following successors breadth-first, see
+    traverse_from.
+    """
+    return traverse_from([start], successors, max_depth, max_nodes, seconds)
+
+
+def traverse_from(starts: Iterable[Hashable],
+                  successors: Callable[[Hashable], Iterable[Hashable]],
+                  max_depth: Optional[int] = None, max_nodes: Optional[int] = None,
+                  seconds: Optional[float] = None) -> Dict:
+    """Return the vertices reachable from any of starts, following successors breadth-first, in
+    a single traversal that expands the vertices shared by several starts only once. The result
+    is a dictionary with the following keys:
+        - 'depths': the vertices reached, in the order they were reached, mapped to their distance
+            in edges from the closest of starts
+        - 'edges': the (tail, head) edges followed between vertices reached
+        - 'depth': the largest distance of a vertex reached
+        - 'backward': whether an edge was followed that does not lead further from starts,
+            which every cycle of the edges followed has. The edges out of the vertices that were
+            not expanded, because the traversal was truncated, are not followed, so the vertices
+            reached may still form a cycle when it is False and 'truncated' is True
+        - 'truncated': whether the traversal stopped before reaching every vertex, because a
+            vertex was further than max_depth, there were more than max_nodes vertices or it took
+            longer than seconds
+
+    Every vertex is expanded at most once, so the traversal terminates even if the vertices form
+    cycles. A budget of None is unlimited.
+    """
+    depths = dict.fromkeys(starts, 0)
+    edges = []
+    queue = list(depths)
+    backward = truncated = False
+    deadline = None if seconds is None else time.perf_counter() + seconds
+
+    for expanded, vertex in enumerate(queue):
+        if deadline is not None and expanded % CLOCK_INTERVAL == 0 \
+                and time.perf_counter() > deadline:
+            truncated = True
+            break
+        depth = depths[vertex]
+        if max_depth is not None and depth >= max_depth:
+            # the vertex is kept, but what lies beyond it is not
+            if any(True for _ in successors(vertex)):
+                truncated = True
+            continue
+        for successor in successors(vertex):
+            if successor not in depths:
+                if max_nodes is not None and len(depths) >= max_nodes:
+                    truncated = True
+                    continue
+                depths[successor] = depth + 1
+                queue.append(successor)
+            elif depths[successor] <= depth:
+                backward = True
+            edges.append((vertex, successor))
+
+    if truncated:
+        count('traversal.truncated')
+    return {'depths': depths, 'edges': edges, 'depth': max(depths.values(), default=0),
+            'backward': backward, 'truncated': truncated}
+
+
+def find_cycles(graph: nx.DiGraph, keep: Optional[Callable[[Hashable], bool]] = None
+                ) -> List[List[Hashable]]:
+    """Return the cycles of graph, as the sorted vertices of each group of vertices that can all
+    reach each other (including a vertex with an edge to itself). If keep is given, only the
+    vertices for which it returns True are listed. The groups are sorted.
+    """
+    cycles = []
+    for component in nx.strongly_connected_components(graph):
+        if len(component) == 1:
+            vertex = next(iter(component))
+            if not graph.has_edge(vertex, vertex):
+                continue
+        members = sorted(vertex for vertex in component if keep is None or keep(vertex))
+        if members != []:
+            cycles.append(members)
+    if cycles != []:
+        count('traversal.cycles', len(cycles))
+    return sorted(cycles)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={
+        'extra-imports': ['time', 'networkx', 'instrumentation'],
+        'allowed-io': [],
+        'max-line-length': 100,
+        'disable': ['E1136']
+    })
@@ -6,50 +6,121 @@ The module contains the code for visualizing graphs.
 """
 
 
-from typing import Dict
+from typing import Dict, List, Optional
 import networkx as nx
+import numpy as np
 import plotly.graph_objects as go
-import pandas as pd
 from future_graph import future
 from data_formatting import get_courses_data
-from prereq_graph import build_trace_graph
+from prereq_graph import build_trace_graph, build_union_trace_graph
+from graph_layout import layout
+from instrumentation import count, request, span, timed
+from traversal import INTERACTIVE_SECONDS
 
-LINE_COLOUR = 'rgb(210,210,210)'
+PREREQ_EDGE_COLOUR = 'red'
+OTHER_EDGE_COLOUR = 'blue'
 VERTEX_BORDER_COLOUR = 'rgb(50, 50, 50)'
 ROOT_COLOUR = 'rgb(89, 205, 105)'
 OTHERS_COLOUR = 'rgb(105, 89, 205)'
+EDGE_OPACITY = 0.4
+ARROW_SIZE = 8
+# how far along each edge its arrowhead is drawn, so that it is not hidden by the head's marker
+ARROW_POSITION = 0.85
+# the most targets listed when hovering over a vertex of a union graph
+HOVER_TARGETS = 8
+# the largest graph whose vertices are labelled with their value, rather than only on hover
+LABEL_MAX_NODES = 70
+# the smallest number of vertices or edges of a graph drawn with WebGL rather than SVG
+WEBGL_MIN_NODES = 1000
+WEBGL_MIN_EDGES = 2000
 
 
 def future_run(future_courses: Dict, course: str) -> None:
     """Return a visualization of the future graph of the given course."""
-    graph = future(future_courses, course)
-    draw_graph(graph)
+    future_figure(future_courses, course).show()
 
 
 def prereq_run(course: str) -> None:
     """Return a visualization of the prerequisites graph of the given course. """
-    courses = get_courses_data()
-    g = build_trace_graph(courses, course)
-    draw_graph(g)
+    prereq_figure(course).show()
+
+
+def future_figure(future_courses: Dict, course: str,
+                  seconds: Optional[float] = INTERACTIVE_SECONDS) -> go.Figure:
+    """Return the figure visualizing the future graph of the given course, without showing it.
+    The graph is cut short if finding its courses takes longer than seconds.
+    """
+    with request(f'future_figure {course}'):
+        graph = future(future_courses, course, seconds=seconds)
+        return build_figure(graph)
+
+
+def prereq_figure(course: str, seconds: Optional[float] = INTERACTIVE_SECONDS) -> go.Figure:
+    """Return the figure visualizing the prerequisites graph of the given course, without showing
+    it. The graph is cut short if finding its courses takes longer than seconds.
+    """
+    with request(f'prereq_figure {course}'):
+        courses = get_courses_data()
+        g = build_trace_graph(courses, course, seconds=seconds)
+        return build_figure(g)
+
+
+def union_figure(targets: List[str], seconds: Optional[float] = INTERACTIVE_SECONDS
+                 ) -> go.Figure:
+    """Return the figure visualizing the union of the prerequisite graphs of the given courses
+    (such as the required courses of a program), without showing it. Hovering over a course shows
+    which of targets need it. The graph is cut short if finding its courses takes longer than
+    seconds.
+    """
+    with request(f'union_figure {len(targets)} courses'):
+        courses = get_courses_data()
+        g = build_union_trace_graph(courses, targets, seconds=seconds)
+        return build_figure(g)
 
 
 def draw_graph(graph: nx.Graph()) -> None:
-    """Return a visual interactive representation of the input graph.
+    """Return a visual interactive representation of the input graph, drawn with WebGL if it is
+    large (see build_figure).
     """
-    if nx.check_planarity(graph)[0]:
-        # if graph is planar, use planar layout
-        pos = getattr(nx, 'planar_layout')(graph)
+    build_figure(graph).show()
+
+
+@timed('figure.build')
+def build_figure(graph: nx.Graph(), webgl: Optional[bool] = None) -> go.Figure:
+    """Return a figure with a visual interactive representation of the input graph, without
+    showing it.
+
+    Graphs with at least WEBGL_MIN_NODES vertices or WEBGL_MIN_EDGES edges are drawn with WebGL
+    (Scattergl) rather than SVG, which keeps big graphs responsive in the browser; webgl forces
+    one or the other when it is not None.
+    """
+    pos = layout(graph)
+    count('figure.nodes', len(graph))
+    count('figure.edges', graph.number_of_edges())
+    if webgl is None:
+        webgl = len(graph) >= WEBGL_MIN_NODES or graph.number_of_edges() >= WEBGL_MIN_EDGES
+
+    # edges are drawn first so that nodes are drawn on top of them
+    if webgl:
+        count('figure.webgl')
+        traces = gl_edge_traces(graph, pos) + gl_node_traces(graph, pos)
     else:
-        # kamada kawai layout
-        # sets optimal distances to be maximum distance in graph.
-        # this makes the algorithm space out nodes further than usual in the visualization
-        df = pd.DataFrame(index=graph.nodes(), columns=graph.nodes())
-        for row, data in nx.shortest_path_length(graph):
-            for col, dist in data.items():
-                df.loc[row, col] = dist
-        df = df.fillna(df.max().max())
-        pos = nx.kamada_kawai_layout(graph, dist=df.to_dict())
+        traces = edge_traces(graph, pos) + [node_trace(graph, pos)]
+    with span('figure.plotly'):
+        fig = go.Figure(data=traces)
+
+        fig.update_layout({'showlegend': False})
+        notes = graph_notes(graph)
+        if notes != []:
+            fig.update_layout(title={'text': '<br>'.join(notes), 'font': {'size': 12}})
+        fig.update_xaxes(showgrid=False, zeroline=False, visible=False)
+        fig.update_yaxes(showgrid=False, zeroline=False, visible=False)
+
+    return fig
+
 
+def node_trace(graph: nx.Graph, pos: dict) -> go.Scatter:
+    """Return the Scatter object drawing the vertices of graph, at the positions in pos."""
     # node coordinates
     x_values = [pos[k][0] for k in graph.nodes]
     y_values = [pos[k][1] for k in graph.nodes]
@@ -59,92 +130,184 @@ def draw_graph(graph: nx.Graph()) -> None:
     colours = [ROOT_COLOUR if graph.nodes[k]['tag'] == 'original' else OTHERS_COLOUR
                for k in graph.nodes]
     # add nodes to diagram
-    if len(labels) > 70:
+    if len(labels) > LABEL_MAX_NODES:
         # if very high number of nodes, only show node markers
         mode = 'markers'
     else:
         # if low-ish number of nodes, display node value next to markers
         mode = 'markers+text'
-    nodes_scatter = go.Scatter(x=x_values,
-                               y=y_values,
-                               mode=mode,
-                               name='nodes',
-                               marker=dict(symbol='circle-dot',
-                                           size=5,
-                                           color=colours,
-                                           line=dict(color=VERTEX_BORDER_COLOUR, width=0.5)
-                                           ),
-                               text=labels,
-                               textposition='top right',
-                               hovertemplate='%{text}',
-                               hoverlabel={'namelength': 0}
-                               )
-
-    if len(graph.edges) > 250:
-        # if very high number of edges, use a faster algorithm to add them to the visualization
-        edges_scatter = add_high_num_edges(graph, pos)
-        fig = go.Figure(data=[edges_scatter, nodes_scatter])
-    else:
-        fig = go.Figure(data=[nodes_scatter])
-        add_edges(graph, fig, pos)
+    return go.Scatter(x=x_values,
+                      y=y_values,
+                      mode=mode,
+                      name='nodes',
+                      marker=dict(symbol='circle-dot',
+                                  size=5,
+                                  color=colours,
+                                  line=dict(color=VERTEX_BORDER_COLOUR, width=0.5)
+                                  ),
+                      text=labels,
+                      textposition='top right',
+                      hovertext=hover_texts(graph),
+                      hovertemplate='%{hovertext}' if 'targets' in graph.graph else '%{text}',
+                      hoverlabel={'namelength': 0}
+                      )
+
+
+@timed('figure.gl_nodes')
+def gl_node_traces(graph: nx.Graph, pos: dict) -> List[go.Scattergl]:
+    """Return Scattergl objects drawing the vertices of graph with WebGL, one for the searched
+    courses and one for the others, so that each has a single colour rather than one per vertex.
+    Labels are only shown on hover.
+    """
+    hovers = hover_texts(graph)
+    groups = {ROOT_COLOUR: [], OTHERS_COLOUR: []}
+    for i, (node, tag) in enumerate(graph.nodes(data='tag')):
+        groups[ROOT_COLOUR if tag == 'original' else OTHERS_COLOUR].append((i, node))
 
-    fig.update_layout({'showlegend': False})
-    fig.update_xaxes(showgrid=False, zeroline=False, visible=False)
-    fig.update_yaxes(showgrid=False, zeroline=False, visible=False)
+    traces = []
+    # the searched courses are drawn last, on top of the others
+    for colour in (OTHERS_COLOUR, ROOT_COLOUR):
+        if groups[colour] == []:
+            continue
+        points = np.array([pos[node] for _, node in groups[colour]], dtype=np.float32)
+        labels = [graph.nodes[node]['value'] if hovers is None else hovers[i]
+                  for i, node in groups[colour]]
+        traces.append(go.Scattergl(x=points[:, 0],
+                                   y=points[:, 1],
+                                   mode='markers',
+                                   name='nodes',
+                                   marker=dict(symbol='circle', size=5, color=colour,
+                                               line=dict(color=VERTEX_BORDER_COLOUR, width=0.5)),
+                                   hovertext=labels,
+                                   hovertemplate='%{hovertext}',
+                                   hoverlabel={'namelength': 0}
+                                   ))
+    return traces
 
-    fig.show()
 
+def hover_texts(graph: nx.Graph) -> Optional[List[str]]:
+    """Return the text shown when hovering over each vertex of a union of trace graphs: its value,
+    followed by the targets that need it. Return None for other graphs, whose vertices only show
+    their value.
+    """
+    if 'targets' not in graph.graph:
+        return None
+    texts = []
+    for node in graph.nodes:
+        targets = graph.nodes[node]['targets']
+        shown = ', '.join(targets[:HOVER_TARGETS])
+        if len(targets) > HOVER_TARGETS:
+            shown += ', ...'
+        texts.append(f'{graph.nodes[node]["value"]}<br>needed by {len(targets)} of '
+                     f'{len(graph.graph["targets"])}: {shown}')
+    return texts
 
-def add_high_num_edges(graph: nx.DiGraph, pos: dict) -> go.Scatter:
-    """Return a Scatter object containing the graph's edges using a faster algortihm than add_edges.
-    This function is used when the graph has a very high number of edges."""
-    x_edges = []
-    y_edges = []
-    for edge in graph.edges:
-        x_edges += [pos[edge[0]][0], pos[edge[1]][0], None]
-        y_edges += [pos[edge[0]][1], pos[edge[1]][1], None]
 
-    edges_scatter = go.Scatter(x=x_edges,
-                               y=y_edges,
-                               mode='lines',
-                               name='edges',
-                               line=dict(color=LINE_COLOUR, width=1),
-                               hoverinfo='none',
-                               )
-    return edges_scatter
+def graph_notes(graph: nx.Graph) -> List[str]:
+    """Return the warnings to show above the figure of graph: whether it was cut short, and the
+    requisite cycles in it, as set by build_trace_graph and future.
+    """
+    notes = []
+    if graph.graph.get('truncated', False):
+        notes.append('Partial graph: the search was cut short, so some courses are missing')
+    for cycle in graph.graph.get('cycles', []):
+        notes.append(f'Requisite cycle: {", ".join(cycle)}')
+    return notes
 
 
 def add_edges(graph: nx.DiGraph, fig: go.Figure, pos: dict) -> None:
     """Mutates fig to add all of graph's directed edges."""
-    for edge in graph.edges:
+    fig.add_traces(edge_traces(graph, pos))
+
+
+@timed('figure.edges')
+def edge_traces(graph: nx.DiGraph, pos: dict) -> List[go.Scatter]:
+    """Return Scatter objects drawing all of graph's directed edges, one for each edge colour.
+    Every edge is a line with an arrowhead near its head, so the cost of drawing an edge does not
+    depend on the number of edges.
+    """
+    edges_by_colour = {}
+    for tail, head, edge_type in graph.edges(data='edge_type'):
         # choose color based on edge type
-        color = 'red' if graph.get_edge_data(edge[0], edge[1])['edge_type'] == 'prereq' else 'blue'
-        # add edge to diagram
-        fig.add_annotation(
-            x=pos[edge[1]][0],  # arrows' head
-            y=pos[edge[1]][1],  # arrows' head
-            ax=pos[edge[0]][0],  # arrows' tail
-            ay=pos[edge[0]][1],  # arrows' tail
-            xref='x',
-            yref='y',
-            axref='x',
-            ayref='y',
-            text='',  # if you want only the arrow
-            showarrow=True,
-            opacity=0.2,
-            arrowhead=3,
-            arrowsize=2,
-            arrowwidth=1,
-            arrowcolor=color
-        )
+        colour = PREREQ_EDGE_COLOUR if edge_type == 'prereq' else OTHER_EDGE_COLOUR
+        edges_by_colour.setdefault(colour, []).append((pos[tail], pos[head]))
+
+    traces = []
+    for colour, edges in edges_by_colour.items():
+        ends = np.array(edges, dtype=float)  # ends[i] is [tail, head] of the i-th edge
+        tails, heads = ends[:, 0], ends[:, 1]
+        # every edge is drawn through 4 points: its tail, its arrowhead, its head and a gap
+        points = np.full((len(edges), 4, 2), np.nan)
+        points[:, 0] = tails
+        points[:, 1] = tails + ARROW_POSITION * (heads - tails)
+        points[:, 2] = heads
+        # only the arrowhead point gets a visible marker, pointing away from the tail
+        sizes = np.zeros((len(edges), 4))
+        sizes[:, 1] = ARROW_SIZE
+
+        traces.append(go.Scatter(x=points[:, :, 0].ravel(),
+                                 y=points[:, :, 1].ravel(),
+                                 mode='lines+markers',
+                                 name='edges',
+                                 line=dict(color=colour, width=1),
+                                 marker=dict(symbol='arrow', angleref='previous',
+                                             size=sizes.ravel(), color=colour),
+                                 opacity=EDGE_OPACITY,
+                                 hoverinfo='none'
+                                 ))
+    return traces
+
+
+@timed('figure.gl_edges')
+def gl_edge_traces(graph: nx.DiGraph, pos: dict) -> List[go.Scattergl]:
+    """Return Scattergl objects drawing all of graph's directed edges with WebGL: for each edge
+    colour, the lines of the edges and their arrowheads, which are markers rotated to point away
+    from the tail since WebGL markers cannot follow the line they are on.
+    """
+    edges_by_colour = {}
+    for tail, head, edge_type in graph.edges(data='edge_type'):
+        colour = PREREQ_EDGE_COLOUR if edge_type == 'prereq' else OTHER_EDGE_COLOUR
+        edges_by_colour.setdefault(colour, []).append((pos[tail], pos[head]))
+
+    traces = []
+    for colour, edges in edges_by_colour.items():
+        ends = np.array(edges, dtype=np.float32)  # ends[i] is [tail, head] of the i-th edge
+        tails, heads = ends[:, 0], ends[:, 1]
+        # every edge is drawn through 3 points: its tail, its head and a gap
+        points = np.full((len(edges), 3, 2), np.nan, dtype=np.float32)
+        points[:, 0] = tails
+        points[:, 1] = heads
+        arrows = tails + ARROW_POSITION * (heads - tails)
+        # marker angles are in degrees clockwise from pointing up
+        angles = np.degrees(np.arctan2(heads[:, 0] - tails[:, 0], heads[:, 1] - tails[:, 1]))
+
+        traces.append(go.Scattergl(x=points[:, :, 0].ravel(),
+                                   y=points[:, :, 1].ravel(),
+                                   mode='lines',
+                                   name='edges',
+                                   line=dict(color=colour, width=1),
+                                   opacity=EDGE_OPACITY,
+                                   hoverinfo='none'
+                                   ))
+        traces.append(go.Scattergl(x=arrows[:, 0],
+                                   y=arrows[:, 1],
+                                   mode='markers',
+                                   name='arrows',
+                                   marker=dict(symbol='triangle-up', size=ARROW_SIZE,
+                                               angle=angles.astype(np.float32), color=colour),
+                                   opacity=EDGE_OPACITY,
+                                   hoverinfo='none'
+                                   ))
+    return traces
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(config={
-        'extra-imports': ['networkx', 'plotly.graph_objects', 'future_graph', 'prereq_graph',
-                          'data_formatting'],
+        'extra-imports': ['networkx', 'numpy', 'plotly.graph_objects', 'future_graph',
+                          'prereq_graph', 'data_formatting', 'graph_layout',
+                          'instrumentation', 'traversal'],
         'allowed-io': [],
         'max-line-length': 100,
         'disable': ['E1136']